@@ -0,0 +1,196 @@
+from __future__ import annotations
+from dotenv import load_dotenv
+import os
+import json
+import time
+import hashlib
+import tempfile
+import asyncio
+import aiofiles
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+load_dotenv()
+
+GITHUB_CACHE_DIR = os.environ.get(
+    "GITHUB_CACHE_DIR", os.path.join(tempfile.gettempdir(), "gitguru", "github")
+)
+GITHUB_CACHE_ENTRIES = int(os.environ.get("GITHUB_CACHE_ENTRIES", "1024"))
+GITHUB_CACHE_DISK_BYTES = int(os.environ.get("GITHUB_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+GITHUB_CACHE_TTL = float(os.environ.get("GITHUB_CACHE_TTL", "60"))
+
+
+class ResponseCache:
+    """
+    Two-tier (memory LRU + disk) cache of GitHub API responses keyed by URL and
+    credential scope (a fingerprint of the tokens that may have fetched them, so
+    one token pool never sees what only another could access).
+    Entries keep their ETag/Last-Modified validators so stale entries can be
+    revalidated with a conditional request; 304s are free against the rate limit.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = GITHUB_CACHE_DIR,
+        max_entries: int = GITHUB_CACHE_ENTRIES,
+        max_disk_bytes: int = GITHUB_CACHE_DISK_BYTES,
+        ttl: float = GITHUB_CACHE_TTL,
+    ):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self._memory: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._disk_bytes: Optional[int] = None
+        self._prune_lock = asyncio.Lock()
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "revalidations": 0,
+            "disk_reads": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def _key(url: str, scope: str = "") -> str:
+        return hashlib.sha256(f"{scope}\0{url}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, url: str, scope: str = "") -> Optional[Dict[str, Any]]:
+        key = self._key(url, scope)
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            return entry
+        if not self.directory:
+            return None
+        try:
+            async with aiofiles.open(self._path(key), mode="r") as file:
+                entry = json.loads(await file.read())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        self.counters["disk_reads"] += 1
+        self._remember(key, entry)
+        return entry
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["stored_at"] < self.ttl
+
+    def conditional_headers(self, entry: Dict[str, Any]) -> Dict[str, str]:
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def hit(self):
+        self.counters["hits"] += 1
+
+    def miss(self):
+        self.counters["misses"] += 1
+
+    async def revalidated(self, url: str, entry: Dict[str, Any], scope: str = ""):
+        self.counters["revalidations"] += 1
+        entry["stored_at"] = time.time()
+        await self._write(self._key(url, scope), entry)
+
+    async def put(self, url: str, body: Any, headers, scope: str = "") -> Optional[Dict[str, Any]]:
+        etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return None
+        entry = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": time.time(),
+            "link": headers.get("Link"),
+            "body": body,
+        }
+        self.counters["stores"] += 1
+        await self._write(self._key(url, scope), entry)
+        return entry
+
+    async def _write(self, key: str, entry: Dict[str, Any]):
+        self._remember(key, entry)
+        if not self.directory:
+            return
+        data = json.dumps(entry)
+        path = self._path(key)
+        # unique per write: concurrent writes of one key must not share a temp file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=key, suffix=".tmp")
+        os.close(fd)
+        try:
+            async with aiofiles.open(tmp_path, mode="w") as file:
+                await file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self._disk_bytes is not None:
+            self._disk_bytes += len(data)
+        if self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes:
+            await self._prune()
+
+    async def _prune(self):
+        async with self._prune_lock:
+            self._disk_bytes, evicted = await asyncio.to_thread(
+                _prune_directory, self.directory, self.max_disk_bytes
+            )
+            self.counters["evictions"] += evicted
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"] + self.counters["revalidations"]
+        return {
+            **self.counters,
+            "memory_entries": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+            # requests that cost no rate-limit quota
+            "quota_saved": self.counters["hits"] + self.counters["revalidations"],
+            "hit_ratio": (self.counters["hits"] + self.counters["revalidations"]) / lookups if lookups else 0.0,
+        }
+
+
+def _prune_directory(directory: str, max_bytes: int) -> tuple[int, int]:
+    """Delete least recently written cache files until the directory fits max_bytes."""
+    files = []
+    total = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    evicted = 0
+    if total > max_bytes:
+        # evict down to 90% so pruning isn't triggered on every write
+        target = max_bytes * 0.9
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+    return total, evicted
+
+
+response_cache = ResponseCache()
@@ -5,10 +5,17 @@ import aiohttp
 import re
 import base64
 import subprocess
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Optional, AsyncIterator, NamedTuple, Union
 import asyncio
 import getpass
 
+from app.sessions import SessionPool, pool
+from app.cache import ResponseCache, response_cache
+from app.singleflight import SingleFlight
+from app.ratelimit import GitHubScheduler
+from app.filetree import FileTree
+from app.issuematch import issue_matcher
+
 load_dotenv()
 
 # Configuration Constants
@@ -17,71 +24,334 @@ BASE_HEADERS = {
     "Accept": "application/vnd.github+json",
     "X-GitHub-Api-Version": GITHUB_API_VERSION
 }
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_GRAPHQL_URL = f"{GITHUB_API_URL}/graphql"
+GITHUB_BULK_CONCURRENCY = int(os.environ.get("GITHUB_BULK_CONCURRENCY", "8"))
+GITHUB_GRAPHQL_BATCH = int(os.environ.get("GITHUB_GRAPHQL_BATCH", "50"))
+# Bounds on how much of an issue thread is loaded
+ISSUE_MAX_COMMENTS = int(os.environ.get("ISSUE_MAX_COMMENTS", "500"))
+ISSUE_MAX_BYTES = int(os.environ.get("ISSUE_MAX_BYTES", str(1024 * 1024)))
+NEXT_LINK = re.compile(r'<([^>]+)>;\s*rel="next"')
+# "api" fetches through the REST/GraphQL endpoints, "tarball" serves from local snapshots
+GITHUB_DATA_BACKEND = os.environ.get("GITHUB_DATA_BACKEND", "api")
+
+# Identical GETs in flight share one request, across all clients in the process using the same tokens
+inflight = SingleFlight()
 
 def get_github_token() -> str:
     if "GITHUB_API_KEY" not in os.environ:
         os.environ["GITHUB_API_KEY"] = getpass.getpass("GitHub API Key:")
     return os.environ["GITHUB_API_KEY"]
 
+def get_github_tokens() -> List[str]:
+    """GITHUB_API_KEYS (comma separated) pooled with GITHUB_API_KEY."""
+    tokens = [t.strip() for t in os.environ.get("GITHUB_API_KEYS", "").split(",") if t.strip()]
+    if not tokens or "GITHUB_API_KEY" in os.environ:
+        tokens.append(get_github_token())
+    return tokens
+
+_scheduler: Optional[GitHubScheduler] = None
+
+def github_scheduler() -> GitHubScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = GitHubScheduler(get_github_tokens())
+    return _scheduler
+
 # Core GitHub Client
 class GitHubClient:
-    def __init__(self):
-        self.token = get_github_token()
-        self.headers = {**BASE_HEADERS, "Authorization": f"Bearer {self.token}"}
-    
+    def __init__(
+        self,
+        sessions: SessionPool = pool,
+        cache: Optional[ResponseCache] = response_cache,
+        scheduler: Optional[GitHubScheduler] = None,
+    ):
+        self.scheduler = scheduler or github_scheduler()
+        self.headers = dict(BASE_HEADERS)
+        self.sessions = sessions
+        self.cache = cache
+        self.cache_scope = self.scheduler.fingerprint()
+
+    async def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None, priority: Optional[int] = None, **kwargs) -> aiohttp.ClientResponse:
+        """
+        Send a request with a token from the scheduler, retrying on rate limits.
+        The caller owns the returned response and must release it (`async with`).
+        """
+        resource = "graphql" if url == GITHUB_GRAPHQL_URL else "core"
+        attempt = 0
+        while True:
+            budget = await self.scheduler.acquire(resource, priority)
+            try:
+                session = await self.sessions.session()
+                response = await session.request(
+                    method, url,
+                    headers={**self.headers, **(headers or {}), "Authorization": f"Bearer {budget.token}"},
+                    **kwargs,
+                )
+                delay = await self.scheduler.observe(budget, resource, response, attempt)
+            finally:
+                self.scheduler.release(budget)
+            if delay is None:
+                return response
+            response.release()
+            attempt += 1
+            await asyncio.sleep(delay)
+
     async def fetch(self, url: str) -> Any:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=self.headers) as response:
-                response.raise_for_status()
-                return await response.json()
+        body, _ = await self.fetch_page(url)
+        return body
+
+    async def fetch_page(self, url: str) -> tuple[Any, Optional[str]]:
+        """Fetch a (possibly paginated) resource, returning the body and the rel="next" URL."""
+        # keyed by credentials too: clients with other tokens must not share a response
+        return await inflight.do((self.cache_scope, url), lambda: self._fetch(url))
+
+    async def _fetch(self, url: str) -> tuple[Any, Optional[str]]:
+        entry = await self.cache.get(url, self.cache_scope) if self.cache else None
+        if entry is not None and self.cache.is_fresh(entry):
+            self.cache.hit()
+            return entry["body"], _next_link(entry.get("link"))
+
+        headers = self.cache.conditional_headers(entry) if entry is not None else None
+        async with await self.request("GET", url, headers=headers) as response:
+            if response.status == 304 and entry is not None:
+                await self.cache.revalidated(url, entry, self.cache_scope)
+                return entry["body"], _next_link(entry.get("link"))
+            response.raise_for_status()
+            body = await response.json()
+
+        if self.cache:
+            self.cache.miss()
+            await self.cache.put(url, body, response.headers, self.cache_scope)
+        return body, _next_link(response.headers.get("Link"))
+
+    async def download(self, url: str, chunk_size: int = 1 << 16) -> AsyncIterator[bytes]:
+        async with await self.request("GET", url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+
+    async def graphql(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        payload = {"query": query, "variables": variables}
+        async with await self.request("POST", GITHUB_GRAPHQL_URL, json=payload) as response:
+            response.raise_for_status()
+            return await response.json()
+
+def _next_link(link: Optional[str]) -> Optional[str]:
+    match = NEXT_LINK.search(link or "")
+    return match.group(1) if match else None
+
+class FileContent(NamedTuple):
+    path: str
+    content: Optional[str] = None
+    error: Optional[str] = None
 
 # Repository Operations
 class RepositoryManager(GitHubClient):
-    async def get_filetree(self, owner: str, repo: str, branch: str = "main") -> List[str]:
-        url = f"https://api.github.com/repos/{owner}/{repo}/git/trees/{branch}?recursive=1"
+    async def get_filetree(self, owner: str, repo: str, branch: str = "main", lazy: bool = False) -> FileTree:
+        """
+        Indexed file tree. When GitHub truncates the recursive listing, the root is
+        listed and subtrees are walked one by one; with lazy=True they are left in
+        `tree.pending` for expand_filetree to load on demand.
+        """
+        url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/git/trees/{branch}?recursive=1"
         data = await self.fetch(url)
-        return [item["path"] for item in data.get("tree", [])]
+        if not data.get("truncated"):
+            tree = FileTree(data.get("tree", []))
+            tree.revision = data.get("sha")
+            return tree
+
+        root = await self.fetch(f"{GITHUB_API_URL}/repos/{owner}/{repo}/git/trees/{branch}")
+        tree = FileTree(root.get("tree", []))
+        tree.revision = root.get("sha")
+        tree.pending.update({e["path"]: e["sha"] for e in root.get("tree", []) if e["type"] == "tree"})
+        if not lazy:
+            await self.expand_filetree(owner, repo, tree)
+        return tree
+
+    async def expand_filetree(self, owner: str, repo: str, tree: FileTree, prefix: str = "", concurrency: int = GITHUB_BULK_CONCURRENCY):
+        """Load the pending subtrees of a truncated tree that overlap `prefix`."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def walk(path: str, sha: str):
+            async with semaphore:
+                data = await self.fetch(f"{GITHUB_API_URL}/repos/{owner}/{repo}/git/trees/{sha}?recursive=1")
+                if data.get("truncated"):
+                    data = await self.fetch(f"{GITHUB_API_URL}/repos/{owner}/{repo}/git/trees/{sha}")
+                    tree.pending.update({f"{path}/{e['path']}": e["sha"] for e in data.get("tree", []) if e["type"] == "tree"})
+            tree.extend(data.get("tree", []), prefix=path)
+            del tree.pending[path]
+
+        while pending := tree.pending_under(prefix):
+            await asyncio.gather(*(walk(path, sha) for path, sha in pending.items()))
+
+    async def local_reader(self, owner: str, repo: str, tree: FileTree) -> Optional[Callable[[str], str]]:
+        """Synchronous reader for the tree's blobs if they are on local disk; None over the API."""
+        return None
 
     async def get_readme(self, owner: str, repo: str) -> str:
-        url = f"https://api.github.com/repos/{owner}/{repo}/readme"
+        url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/readme"
         data = await self.fetch(url)
         return base64.b64decode(data["content"]).decode("utf-8")
 
     async def get_file_content(self, owner: str, repo: str, path: str) -> str:
-        url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path}"
+        url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/contents/{path}"
         data = await self.fetch(url)
         return base64.b64decode(data["content"]).decode("utf-8")
 
     async def get_languages(self, owner: str, repo: str) -> Dict[str, int]:
-        url = f"https://api.github.com/repos/{owner}/{repo}/languages"
+        url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/languages"
         return await self.fetch(url)
 
+    async def iter_file_contents(
+        self,
+        owner: str,
+        repo: str,
+        paths: List[str],
+        ref: str = "HEAD",
+        concurrency: int = GITHUB_BULK_CONCURRENCY,
+        batch_size: int = GITHUB_GRAPHQL_BATCH,
+    ) -> AsyncIterator[FileContent]:
+        """
+        Yield FileContent results as they complete. Multiple paths are fetched as
+        GraphQL blob batches; a failed file comes back with `error` set instead of
+        failing the whole batch.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def rest(path: str) -> FileContent:
+            async with semaphore:
+                try:
+                    return FileContent(path, await self.get_file_content(owner, repo, path))
+                except Exception as e:
+                    return FileContent(path, error=str(e))
+
+        async def batch(chunk: List[str]) -> List[FileContent]:
+            async with semaphore:
+                try:
+                    results = await self._graphql_blobs(owner, repo, chunk, ref)
+                except Exception:
+                    results = {}
+            # binaries, truncated blobs and failed batches go through the contents API
+            retry = [p for p in chunk if p not in results]
+            return [FileContent(p, results[p]) for p in chunk if p in results] + \
+                list(await asyncio.gather(*(rest(p) for p in retry)))
+
+        paths = list(dict.fromkeys(paths))
+        if len(paths) == 1:
+            tasks = [asyncio.ensure_future(rest(paths[0]))]
+        else:
+            tasks = [
+                asyncio.ensure_future(batch(paths[i:i + batch_size]))
+                for i in range(0, len(paths), batch_size)
+            ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                for item in (result if isinstance(result, list) else [result]):
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_file_contents(self, owner: str, repo: str, paths: List[str], **kwargs) -> Dict[str, FileContent]:
+        return {r.path: r async for r in self.iter_file_contents(owner, repo, paths, **kwargs)}
+
+    async def _graphql_blobs(self, owner: str, repo: str, paths: List[str], ref: str) -> Dict[str, str]:
+        fields = " ".join(
+            f"f{i}: object(expression: $e{i}) {{ ... on Blob {{ text isBinary isTruncated }} }}"
+            for i in range(len(paths))
+        )
+        params = "".join(f", $e{i}: String!" for i in range(len(paths)))
+        query = f"query($owner: String!, $name: String!{params}) {{ repository(owner: $owner, name: $name) {{ {fields} }} }}"
+        variables = {"owner": owner, "name": repo, **{f"e{i}": f"{ref}:{p}" for i, p in enumerate(paths)}}
+        data = (await self.graphql(query, variables)).get("data") or {}
+        blobs = data.get("repository") or {}
+        results = {}
+        for i, path in enumerate(paths):
+            blob = blobs.get(f"f{i}")
+            if blob and blob.get("text") is not None and not blob.get("isBinary") and not blob.get("isTruncated"):
+                results[path] = blob["text"]
+        return results
+
+def repository_manager(**kwargs) -> RepositoryManager:
+    if GITHUB_DATA_BACKEND == "tarball":
+        from app.snapshot import SnapshotRepositoryManager
+        return SnapshotRepositoryManager(**kwargs)
+    return RepositoryManager(**kwargs)
+
 # Issue Operations
 class IssueManager(GitHubClient):
     async def get_issue(self, owner: str, repo: str, number: int) -> Dict:
-        url = f"https://api.github.com/repos/{owner}/{repo}/issues/{number}"
+        url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/issues/{number}"
         return await self.fetch(url)
 
-    async def get_issue_comments(self, owner: str, repo: str, number: int) -> List[Dict]:
-        url = f"https://api.github.com/repos/{owner}/{repo}/issues/{number}/comments"
-        return await self.fetch(url)
+    async def iter_issue_comments(
+        self,
+        owner: str,
+        repo: str,
+        number: int,
+        per_page: int = 100,
+        max_comments: int = ISSUE_MAX_COMMENTS,
+        max_bytes: int = ISSUE_MAX_BYTES,
+    ) -> AsyncIterator[Dict]:
+        """
+        Yield comments page by page following Link pagination. The next page is
+        requested before the current one is handed out, and the thread stops at
+        max_comments or max_bytes of comment bodies.
+        """
+        url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/issues/{number}/comments?per_page={per_page}"
+        page = asyncio.ensure_future(self.fetch_page(url))
+        count = size = 0
+        try:
+            while page is not None:
+                comments, next_url = await page
+                page = asyncio.ensure_future(self.fetch_page(next_url)) if next_url else None
+                for comment in comments:
+                    size += len(comment.get("body") or "")
+                    if count >= max_comments or size > max_bytes:
+                        return
+                    count += 1
+                    yield comment
+        finally:
+            if page is not None:
+                page.cancel()
+
+    async def get_issue_comments(self, owner: str, repo: str, number: int, **kwargs) -> List[Dict]:
+        return [c async for c in self.iter_issue_comments(owner, repo, number, **kwargs)]
 
-    async def full_issue_thread(self, owner: str, repo: str, number: int) -> List[str]:
-        issue = await self.get_issue(owner, repo, number)
-        comments = await self.get_issue_comments(owner, repo, number)
-        return [
-            f"{issue['title']}\n{issue['body']}",
-            *[f"@{c['user']['login']}: {c['body']}" for c in comments]
-        ]
+    async def iter_issue_thread(self, owner: str, repo: str, number: int, **kwargs) -> AsyncIterator[str]:
+        comments = self.iter_issue_comments(owner, repo, number, **kwargs)
+        # start on the first comment page while the issue itself loads
+        first = asyncio.ensure_future(anext(comments, None))
+        try:
+            issue = await self.get_issue(owner, repo, number)
+            yield f"{issue['title']}\n{issue['body']}"
+            comment = await first
+            while comment is not None:
+                yield f"@{comment['user']['login']}: {comment['body']}"
+                comment = await anext(comments, None)
+        finally:
+            if not first.done():
+                first.cancel()
+                await asyncio.gather(first, return_exceptions=True)
+            await comments.aclose()
+
+    async def full_issue_thread(self, owner: str, repo: str, number: int, **kwargs) -> List[str]:
+        return [message async for message in self.iter_issue_thread(owner, repo, number, **kwargs)]
 
 # Analysis Utilities
 class RepoAnalyzer:
     @staticmethod
-    def filter_text_files(paths: List[str]) -> List[str]:
+    def filter_text_files(paths: Union[FileTree, List[str]]) -> List[str]:
+        if isinstance(paths, FileTree):
+            return paths.union(paths.with_extension(".md", ".rst"), paths.with_root_prefix("readme"))
         return [p for p in paths if p.endswith((".md", ".rst")) or p.lower().startswith("readme")]
 
     @staticmethod
-    def filter_files(paths: List[str], *ext: str) -> List[str]:
+    def filter_files(paths: Union[FileTree, List[str]], *ext: str) -> List[str]:
+        if isinstance(paths, FileTree):
+            return paths.with_extension(*ext)
         return [p for p in paths if p.endswith(ext)]
     @staticmethod
     def extract_code_blocks(text: str) -> List[str]:
@@ -89,34 +359,58 @@ class RepoAnalyzer:
 
 # Feature Pipelines
 async def analyze_repository(owner: str, repo: str) -> Dict[str, Any]:
-    repo_mgr = RepositoryManager()
+    repo_mgr = repository_manager()
+    structure, readme, languages = await asyncio.gather(
+        repo_mgr.get_filetree(owner, repo),
+        repo_mgr.get_readme(owner, repo),
+        repo_mgr.get_languages(owner, repo),
+    )
     return {
-        "structure": await repo_mgr.get_filetree(owner, repo),
-        "readme": await repo_mgr.get_readme(owner, repo),
-        "languages": await repo_mgr.get_languages(owner, repo),
-        "documentation": RepoAnalyzer.filter_text_files(await repo_mgr.get_filetree(owner, repo))
+        "structure": structure,
+        "readme": readme,
+        "languages": languages,
+        "documentation": RepoAnalyzer.filter_text_files(structure)
     }
 
 async def generate_docs_summary(owner: str, repo: str) -> str:
-    repo_mgr = RepositoryManager()
-    readme = await repo_mgr.get_readme(owner, repo)
-    files = RepoAnalyzer.filter_text_files(await repo_mgr.get_filetree(owner, repo))
+    repo_mgr = repository_manager()
+    readme, tree = await asyncio.gather(
+        repo_mgr.get_readme(owner, repo),
+        repo_mgr.get_filetree(owner, repo),
+    )
+    files = RepoAnalyzer.filter_text_files(tree)
     files= files[:10]
-    contents = [readme] + [await repo_mgr.get_file_content(owner, repo, p) for p in files]
+    fetched = await repo_mgr.get_file_contents(owner, repo, files)
+    contents = [readme] + [fetched[p].content for p in files if fetched[p].content is not None]
     return "\n\n".join(contents)
 
 async def find_issue_context(owner: str, repo: str, issue_number: int) -> Dict:
     issue_mgr = IssueManager()
-    repo_mgr = RepositoryManager()
-    
-    thread = await issue_mgr.full_issue_thread(owner, repo, issue_number)
-    code_blocks = [b for msg in thread for b in RepoAnalyzer.extract_code_blocks(msg)]
-    files = await repo_mgr.get_filetree(owner, repo)
-    
+    repo_mgr = repository_manager()
+
+    async def load_index():
+        # build the identifier index while the rest of the thread is still loading
+        files = await repo_mgr.get_filetree(owner, repo)
+        read = await repo_mgr.local_reader(owner, repo, files)
+        return files, await issue_matcher.get(owner, repo, files, read)
+
+    index = asyncio.ensure_future(load_index())
+    thread, code_blocks = [], []
+    try:
+        async for message in issue_mgr.iter_issue_thread(owner, repo, issue_number):
+            thread.append(message)
+            code_blocks.extend(RepoAnalyzer.extract_code_blocks(message))
+    except BaseException:
+        index.cancel()
+        raise
+    files, identifiers = await index
+
     return {
         "conversation": thread,
         "code_blocks": code_blocks,
-        "related_files": files  # Add semantic matching here
+        "tree": files,
+        # files the thread points at through stack frames, file names, imports and identifiers
+        "related_files": issue_matcher.match(identifiers, thread),
     }
 
 
@@ -131,8 +425,9 @@ if __name__ == "__main__":
         print(f"Repo contains {len(analysis['structure'])} files")
         print(f"Top language: {max(analysis['languages'], key=analysis['languages'].get)}")
         print(f"Documentation files: {len(analysis['documentation'])}")
+        await pool.close()
         
-        # Clone repository
-        # subprocess.run(["git", "clone", f"https://github.com/{owner}/{repo}.git"], check=True)
+        # Checkout repository (shared mirror, see app.mirrors)
+        # with mirror_cache.checkout(f"https://github.com/{owner}/{repo}.git") as path: ...
 
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,161 @@
+from __future__ import annotations
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+
+class _Node:
+    __slots__ = ("id", "children")
+
+    def __init__(self):
+        self.id = -1
+        self.children: Dict[str, _Node] = {}
+
+
+class FileTree(Sequence[str]):
+    """
+    Indexed repository tree. Behaves like the old flat list of paths, but keeps a
+    path trie of interned segments plus extension and basename indexes so lookups
+    don't rescan every entry. Sizes and blob SHAs are stored in compact arrays.
+    Subtrees of a truncated GitHub tree are recorded in `pending` until expanded.
+    """
+
+    def __init__(self, entries: Iterable[Dict] = (), prefix: str = ""):
+        self.paths: List[str] = []
+        self.types: List[str] = []
+        self.sizes = array("q")
+        self._shas = bytearray()
+        self._root = _Node()
+        self.by_ext: Dict[str, List[int]] = {}
+        self.by_basename: Dict[str, List[int]] = {}
+        self.pending: Dict[str, str] = {}
+        # tree or commit SHA the listing was taken at, when known
+        self.revision: Optional[str] = None
+        self.extend(entries, prefix)
+
+    # Building
+    def add(self, path: str, type: str = "blob", size: int = 0, sha: Optional[str] = None) -> int:
+        node = self._root
+        for segment in path.split("/"):
+            child = node.children.get(segment)
+            if child is None:
+                child = node.children[sys.intern(segment)] = _Node()
+            node = child
+        if node.id != -1:
+            return node.id
+
+        entry_id = node.id = len(self.paths)
+        self.paths.append(path)
+        self.types.append(sys.intern(type))
+        self.sizes.append(size or 0)
+        self._shas += bytes.fromhex(sha) if sha and len(sha) == 40 else bytes(20)
+
+        basename = path.rsplit("/", 1)[-1]
+        self.by_basename.setdefault(basename.lower(), []).append(entry_id)
+        dot = basename.rfind(".")
+        if dot != -1:
+            self.by_ext.setdefault(basename[dot:], []).append(entry_id)
+        return entry_id
+
+    def extend(self, entries: Iterable[Dict], prefix: str = ""):
+        """Add GitHub git/trees entries, optionally rooted under `prefix`."""
+        for item in entries:
+            path = f"{prefix}/{item['path']}" if prefix else item["path"]
+            self.add(path, item.get("type", "blob"), item.get("size", 0), item.get("sha"))
+
+    # Sequence protocol, so existing list-based callers keep working
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, index: Union[int, slice]):
+        return self.paths[index]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.paths)
+
+    def __contains__(self, path) -> bool:
+        return self._find(path) is not None
+
+    # Lookups
+    def _find(self, path: str) -> Optional[_Node]:
+        node = self._root
+        for segment in path.strip("/").split("/") if path.strip("/") else []:
+            node = node.children.get(segment)
+            if node is None:
+                return None
+        return node
+
+    def _collect(self, ids: Iterable[int]) -> List[str]:
+        return [self.paths[i] for i in sorted(set(ids))]
+
+    def union(self, *path_lists: Iterable[str]) -> List[str]:
+        """Merge lookup results back into tree order without duplicates."""
+        return self._collect(self._find(p).id for paths in path_lists for p in paths)
+
+    def entry(self, path: str) -> Optional[Dict]:
+        node = self._find(path)
+        if node is None or node.id == -1:
+            return None
+        i = node.id
+        return {"path": self.paths[i], "type": self.types[i], "size": self.sizes[i], "sha": self.sha(i)}
+
+    def sha(self, entry_id: int) -> Optional[str]:
+        raw = self._shas[entry_id * 20:(entry_id + 1) * 20]
+        return raw.hex() if any(raw) else None
+
+    def files(self) -> List[str]:
+        return [p for p, t in zip(self.paths, self.types) if t == "blob"]
+
+    def with_extension(self, *exts: str) -> List[str]:
+        """Paths ending with any of `exts`, in tree order (same result as str.endswith)."""
+        ids = []
+        for ext in exts:
+            dot = ext.rfind(".")
+            if dot == -1:
+                ids.extend(i for i, p in enumerate(self.paths) if p.endswith(ext))
+            elif dot == 0:
+                ids.extend(self.by_ext.get(ext, ()))
+            else:
+                # compound suffix like ".tar.gz" or "setup.py": narrow by the last extension
+                ids.extend(i for i in self.by_ext.get(ext[dot:], ()) if self.paths[i].endswith(ext))
+        return self._collect(ids)
+
+    def with_root_prefix(self, prefix: str) -> List[str]:
+        """Paths whose lowercased form starts with `prefix` (no "/" in prefix)."""
+        prefix = prefix.lower()
+        ids = []
+        for segment, node in self._root.children.items():
+            if segment.lower().startswith(prefix):
+                ids.extend(self._ids_under(node))
+        return self._collect(ids)
+
+    def with_basename(self, name: str) -> List[str]:
+        return self._collect(self.by_basename.get(name.lower(), ()))
+
+    def children(self, directory: str = "") -> List[str]:
+        node = self._find(directory)
+        if node is None:
+            return []
+        return self._collect(c.id for c in node.children.values() if c.id != -1)
+
+    def under(self, prefix: str = "") -> List[str]:
+        node = self._find(prefix)
+        if node is None:
+            return []
+        return self._collect(self._ids_under(node))
+
+    def _ids_under(self, node: _Node) -> List[int]:
+        ids, stack = [], [node]
+        while stack:
+            node = stack.pop()
+            if node.id != -1:
+                ids.append(node.id)
+            stack.extend(node.children.values())
+        return ids
+
+    def pending_under(self, prefix: str = "") -> Dict[str, str]:
+        prefix = prefix.strip("/")
+        return {
+            path: sha for path, sha in self.pending.items()
+            if not prefix or path == prefix or path.startswith(prefix + "/") or prefix.startswith(path + "/")
+        }
@@ -1,10 +1,16 @@
 from goap.llm import EvalInjectLLM, Embeddings, acluster, chunk, SemanticAction, RegexAction, memDB
+from goap.cache import completion_cache, embedding_cache
+from goap.packing import estimate_tokens, pack, truncate_to_budget
+from goap.retrieval import hybrid_search
+from app.pathindex import PathIndex
 from sast.semgrep import SemgrepScanner
 from sast.searxng import SearxngSearch
 import asyncio
 import tempfile
 import aiofiles
 from dotenv import load_dotenv
+from contextvars import ContextVar
+from typing import Callable, Optional
 import os
 
 load_dotenv()
@@ -12,49 +18,82 @@ load_dotenv()
 PORT_OLLAMA=os.environ["PORT_OLLAMA"]
 LLM_MODEL=os.environ["LLM_MODEL"]
 EMBED_MODEL=os.environ["EMBED_MODEL"]
+# opt-in: identical prompts return the stored answer instead of sampling again
+COMPLETION_CACHE=os.environ.get("COMPLETION_CACHE", "0") == "1"
+# Token budget for summarize: context window minus room for the answer
+LLM_CONTEXT_TOKENS=int(os.environ.get("LLM_CONTEXT_TOKENS", "8192"))
+SUMMARY_RESERVED_TOKENS=int(os.environ.get("SUMMARY_RESERVED_TOKENS", "1024"))
+SUMMARY_MAX_ROUNDS=5
 
-llm = EvalInjectLLM(f"http://ollama:11434/v1", f"{LLM_MODEL}", api_key="ollama")
-embeddings = Embeddings(f"http://ollama:11434/v1", f"{EMBED_MODEL}", api_key="ollama")
+llm = EvalInjectLLM(f"http://ollama:11434/v1", f"{LLM_MODEL}", cache=completion_cache if COMPLETION_CACHE else None, api_key="ollama")
+embeddings = Embeddings(f"http://ollama:11434/v1", f"{EMBED_MODEL}", cache=embedding_cache, api_key="ollama")
+path_index = PathIndex(embeddings)
+
+# Progress callback for streaming routes: progress.get()(stage, info) when set
+progress: ContextVar[Optional[Callable[[str, dict], None]]] = ContextVar("progress", default=None)
+
+def report(stage: str, **info):
+    callback = progress.get()
+    if callback is not None:
+        callback(stage, info)
 
 # Summarization pipeline (Longsum)
+def summary_prompt(objective: str, text: str) -> list[dict]:
+    return [{"role": "user", "content": f"Summarize the following {objective}, be specific and capture the details: {text}"}]
+
+async def summary_messages(objective: str, text: str) -> list[dict]:
+    """Map/reduce `text` until it fits one prompt; returns the messages of that final call."""
+    budget = LLM_CONTEXT_TOKENS - SUMMARY_RESERVED_TOKENS - estimate_tokens(summary_prompt(objective, "")[0]["content"])
+    if estimate_tokens(text) <= budget:
+        return summary_prompt(objective, text)
+    chunks = chunk(text, "\n")
+    report("cluster", chunks=len(chunks))
+    clusters = await acluster(chunks, embeddings, min_s=2, max_s=1000)
+    # as few map calls as fit the context window, then reduce recursively until one call covers everything
+    summaries = clusters
+    for i in range(SUMMARY_MAX_ROUNDS):
+        groups = pack(summaries, budget)
+        if len(groups) == 1:
+            break
+        report("map" if i == 0 else "reduce", round=i, calls=len(groups))
+        summaries = await asyncio.gather(*(llm.gen(summary_prompt(objective, " -- ".join(group))) for group in groups))
+    text = " -- ".join(summaries)
+    if estimate_tokens(text) > budget:
+        # SUMMARY_MAX_ROUNDS reductions did not converge; never send more than the window holds
+        report("truncate", tokens=estimate_tokens(text), budget=budget)
+        text = truncate_to_budget(text, budget)
+    return summary_prompt(objective, text)
+
 async def summarize(objective="", text=""):
     if not text:
         return
-    chunks = chunk(text, "\n")
-    clusters = await acluster(chunks, embeddings, min_s=2, max_s=1000)
-    cluster_sums = [llm.gen([{"role": "user", "content": f"Summarize the following {objective}, be specific and capture the details: {text}"}]) for text in clusters]
-    cluster_sums = await asyncio.gather(*cluster_sums)
-    return await llm.gen([{"role": "user", "content": f"Summarize the following {objective}, be specific and capture the details: {' -- '.join(cluster_sums)}"}])
+    return await llm.gen(await summary_messages(objective, text))
 
 async def filter_vec(texts: list[str], objective: str, k=10):
-    vecs = await embeddings.gen(texts)
-    db = memDB()
-    db.extend(texts, vecs)
-    top_texts = db.search(objective, k)
-    return top_texts
+    # BM25 prunes large candidate sets before anything is embedded
+    return await hybrid_search(texts, objective, embeddings, k)
 
-async def extract(objective: str, texts: list[str], *args):
+async def extract_messages(objective: str, texts: list[str], *args) -> list[dict]:
+    report("retrieve", texts=len(texts))
     top_texts = await filter_vec(texts, objective)
     extra_args = " ".join(args)
-    return await llm.gen([{"role": "user", "content": f"Filter and extract the most suitable {objective} for {extra_args} from the following texts: {' -- '.join(top_texts)}"}])
+    return [{"role": "user", "content": f"Filter and extract the most suitable {objective} for {extra_args} from the following texts: {' -- '.join(top_texts)}"}]
 
-async def extract_and_summarize(objective: str, texts: list[str], *args):
-    vecs = await embeddings.gen(texts)
-    db = memDB()
-    db.extend(texts, vecs)
-    top_texts = db.search(objective, 10)
-    extra_args = " ".join(args)
-    return await summarize(objective+extra_args, await extract(objective, top_texts, *args))
+async def extract(objective: str, texts: list[str], *args):
+    return await llm.gen(await extract_messages(objective, texts, *args))
 
-async def select(texts: list[str], *args):
+async def extract_and_summarize_messages(objective: str, texts: list[str], *args) -> list[dict]:
+    vecs = await embeddings.gen(texts + [objective])
+    db = memDB()
+    db.extend(texts, vecs[:-1])
+    top_texts = db.search(vecs[-1], 10)
     extra_args = " ".join(args)
-    top_texts = await filter_vec(texts, extra_args)
-    top_text_reasoning = [llm.gen([{"role": "user", "content": f"Tell me why {text} would be a good {extra_args}"}]) for text in top_texts]
-    top_text_reasoning = await asyncio.gather(*top_text_reasoning)
-    mapping = dict(zip(top_text_reasoning, top_texts))
-    top_texts_by_reasoning = await filter_vec(top_text_reasoning, extra_args)
-    return mapping[top_texts_by_reasoning[0]]
+    extracted = await extract(objective, top_texts, *args)
+    report("summarize")
+    return await summary_messages(objective+extra_args, extracted)
 
+async def extract_and_summarize(objective: str, texts: list[str], *args):
+    return await llm.gen(await extract_and_summarize_messages(objective, texts, *args))
 
 async def save_to_tempfile(data: str) -> str:
     # Create a temporary file
@@ -0,0 +1,260 @@
+from __future__ import annotations
+from dotenv import load_dotenv
+import os
+import re
+import math
+import asyncio
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from app.filetree import FileTree
+from app.singleflight import SingleFlight
+
+load_dotenv()
+
+ISSUE_RELATED_FILES = int(os.environ.get("ISSUE_RELATED_FILES", "20"))
+ISSUE_INDEX_CACHE = int(os.environ.get("ISSUE_INDEX_CACHE", "16"))
+# Source files above this size are matched by path only
+ISSUE_SYMBOL_MAX_BYTES = int(os.environ.get("ISSUE_SYMBOL_MAX_BYTES", str(256 * 1024)))
+
+SOURCE_EXTENSIONS = (
+    "py", "pyi", "js", "jsx", "mjs", "cjs", "ts", "tsx", "go", "rs", "java", "kt", "scala",
+    "rb", "php", "c", "h", "cc", "cpp", "hpp", "cs", "swift", "m", "lua", "sh", "ex", "exs",
+)
+# how much one mention of each kind counts, before idf
+WEIGHT_PATH = 4.0
+WEIGHT_FRAME = 3.0
+WEIGHT_MODULE = 3.0
+WEIGHT_IMPORTED = 2.0
+WEIGHT_IDENTIFIER = 1.0
+
+_CODE_BLOCK = re.compile(r"```[^\n]*\n?([\s\S]*?)```")
+_BACKTICKED = re.compile(r"`([^`\n]+)`")
+_PY_FRAME = re.compile(r'File "([^"]+)", line \d+(?:, in ([\w<>]+))?')
+_AT_FRAME = re.compile(r"\bat (?:([\w$.<>]+) )?\(?((?:[\w.@-]+[/\\])*[\w.-]+\.\w+):\d+(?::\d+)?\)?")
+_FILE = re.compile(
+    r"(?<![\w/.-])((?:[\w.@-]+[/\\])*[\w-][\w.-]*\.(?:" + "|".join(SOURCE_EXTENSIONS)
+    + r"|json|ya?ml|toml|cfg|ini|md|rst|txt))\b"
+)
+_FROM_IMPORT = re.compile(r"^\s*from\s+([\w.]+)\s+import\s+\(?([\w\s,]+)", re.M)
+_IMPORT = re.compile(r"^\s*import\s+([\w.]+)", re.M)
+_JS_IMPORT = re.compile(r"""(?:\bfrom\s+|\brequire\(\s*|\bimport\(\s*|^\s*import\s+)['"]([^'"]+)['"]""", re.M)
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+# identifiers that stand out in prose: snake_case, camelCase / PascalCase with an inner capital, calls
+_PROSE_IDENTIFIER = re.compile(r"\b(?:[a-z0-9]+_\w+|[A-Za-z][a-z0-9]+[A-Z]\w*|[A-Za-z_]\w{2,}(?=\())")
+_SYMBOL = re.compile(
+    r"\b(?:def|class|function|func|fn|struct|enum|trait|interface|type|module|object)\s+"
+    r"(?:\([^)]*\)\s*)?\*?([A-Za-z_$][\w$]*)"
+    r"|\b(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s*)?(?:function\b|\([^)]*\)\s*=>|[\w$]+\s*=>)"
+)
+_PACKAGE_FILES = ("__init__", "index", "mod")
+_STOPWORDS = frozenset("""
+    and the for not none true false null self this return import from def class function const let var
+    async await try except catch finally raise throw new with while else elif if print int str dict list
+    len range type object string number boolean void public private static final package lambda yield
+    pass break continue assert global nonlocal del undefined error exception traceback file line most
+    recent call last
+""".split())
+
+
+class IssueReferences(NamedTuple):
+    """Weighted mentions found in an issue thread, keyed by lowercased text."""
+    paths: Dict[str, float]
+    modules: Dict[str, float]
+    identifiers: Dict[str, float]
+
+
+def _bump(terms: Dict[str, float], key: str, weight: float):
+    key = key.strip().strip("./\\").lower()
+    if key and key not in _STOPWORDS:
+        terms[key] = max(terms.get(key, 0.0), weight)
+
+
+def extract_references(texts: Iterable[str]) -> IssueReferences:
+    """Stack-trace frames, file names, import paths and identifiers mentioned in `texts`."""
+    paths: Dict[str, float] = {}
+    modules: Dict[str, float] = {}
+    identifiers: Dict[str, float] = {}
+    for text in texts:
+        code = "\n".join(_CODE_BLOCK.findall(text) + _BACKTICKED.findall(text))
+        for path, function in _PY_FRAME.findall(text):
+            _bump(paths, path.replace("\\", "/"), WEIGHT_FRAME)
+            if function:
+                _bump(identifiers, function, WEIGHT_FRAME)
+        for function, path in _AT_FRAME.findall(text):
+            _bump(paths, path.replace("\\", "/"), WEIGHT_FRAME)
+            if function:
+                _bump(identifiers, function.rsplit(".", 1)[-1], WEIGHT_FRAME)
+        for path in _FILE.findall(text):
+            _bump(paths, path.replace("\\", "/"), WEIGHT_PATH)
+        for module, names in _FROM_IMPORT.findall(code):
+            _bump(modules, module.replace(".", "/"), WEIGHT_MODULE)
+            for name in names.replace("\n", ",").split(","):
+                _bump(identifiers, name.strip().split(" ")[0], WEIGHT_IMPORTED)
+        for module in _IMPORT.findall(code):
+            _bump(modules, module.replace(".", "/"), WEIGHT_MODULE)
+        for module in _JS_IMPORT.findall(code):
+            _bump(modules, module, WEIGHT_MODULE)
+        for word in _IDENTIFIER.findall(code):
+            _bump(identifiers, word, WEIGHT_IDENTIFIER)
+        for word in _PROSE_IDENTIFIER.findall(_CODE_BLOCK.sub(" ", text)):
+            _bump(identifiers, word, WEIGHT_IDENTIFIER)
+    return IssueReferences(paths, modules, identifiers)
+
+
+def _stem(path: str) -> str:
+    """Module name of a file: basename without extension, or its directory for __init__ / index / mod files."""
+    segments = path.lower().split("/")
+    name = segments[-1].split(".", 1)[0]
+    if name in _PACKAGE_FILES and len(segments) > 1:
+        return segments[-2]
+    return name
+
+
+class IdentifierIndex:
+    """
+    Inverted index over one repository revision: file basenames, module stems,
+    directory names and (when blob contents are local) the symbols each source
+    file defines, all mapped to file ids. Matching an issue is a handful of dict
+    lookups, scored by mention weight times idf.
+    """
+
+    def __init__(self, tree: FileTree, read: Optional[Callable[[str], str]] = None):
+        self.paths = tree.files()
+        self.basenames: Dict[str, List[int]] = {}
+        self.stems: Dict[str, List[int]] = {}
+        self.components: Dict[str, List[int]] = {}
+        self.symbols: Dict[str, List[int]] = {}
+        sizes = {path: size for path, size in zip(tree.paths, tree.sizes)}
+        for file_id, path in enumerate(self.paths):
+            segments = path.lower().split("/")
+            self.basenames.setdefault(segments[-1], []).append(file_id)
+            self.stems.setdefault(_stem(path), []).append(file_id)
+            for segment in set(segments[:-1]):
+                self.components.setdefault(segment, []).append(file_id)
+            if read is None or sizes.get(path, 0) > ISSUE_SYMBOL_MAX_BYTES \
+                    or path.rsplit(".", 1)[-1].lower() not in SOURCE_EXTENSIONS:
+                continue
+            try:
+                text = read(path)
+            except (OSError, UnicodeDecodeError, KeyError):
+                continue
+            for symbol in {a or b for a, b in _SYMBOL.findall(text)}:
+                self.symbols.setdefault(symbol.lower(), []).append(file_id)
+
+    def _idf(self, df: int) -> float:
+        return math.log(1 + len(self.paths) / df)
+
+    def _suffix_matches(self, reference: str, candidates: List[int], module: bool) -> tuple[List[int], float]:
+        """
+        Candidates sharing the longest trailing run of directories with `reference`,
+        and the fraction of its directories matched (an absolute path from a stack
+        trace may point outside the repo, so a bare basename match counts less).
+        """
+        wanted = reference.split("/")[:-1]
+        best, matched = -1, []
+        for file_id in candidates:
+            segments = self.paths[file_id].lower().split("/")
+            if module and len(segments) > 1 and segments[-1].split(".", 1)[0] in _PACKAGE_FILES:
+                segments = segments[:-1]  # package file: the module is its directory
+            segments = segments[:-1]
+            depth = 0
+            while depth < min(len(wanted), len(segments)) and wanted[-1 - depth] == segments[-1 - depth]:
+                depth += 1
+            if depth > best:
+                best, matched = depth, [file_id]
+            elif depth == best:
+                matched.append(file_id)
+        return matched, (1 + best) / (1 + len(wanted))
+
+    def match(self, references: IssueReferences, k: int = ISSUE_RELATED_FILES) -> List[str]:
+        """Up to `k` paths ranked by how strongly the issue refers to them."""
+        scores: Dict[int, float] = {}
+
+        def add(ids: List[int], weight: float):
+            if ids:
+                score = weight * self._idf(len(ids))
+                for file_id in ids:
+                    scores[file_id] = scores.get(file_id, 0.0) + score
+
+        for path, weight in references.paths.items():
+            candidates = self.basenames.get(path.rsplit("/", 1)[-1], [])
+            matched, fraction = self._suffix_matches(path, candidates, module=False)
+            add(matched, weight * fraction)
+        for module, weight in references.modules.items():
+            candidates = self.stems.get(module.rsplit("/", 1)[-1].split(".", 1)[0], [])
+            matched, fraction = self._suffix_matches(module, candidates, module=True)
+            add(matched, weight * fraction)
+        for identifier, weight in references.identifiers.items():
+            add(self.symbols.get(identifier, []), 2 * weight)
+            add(self.stems.get(identifier, []), weight)
+            add(self.components.get(identifier, []), weight / 2)
+
+        ranked = sorted(scores, key=lambda file_id: (-scores[file_id], file_id))[:k]
+        return [self.paths[file_id] for file_id in ranked]
+
+
+class IssueMatcher:
+    """IdentifierIndex per (repo, tree revision), built once in a worker thread and kept LRU."""
+
+    def __init__(self, capacity: int = ISSUE_INDEX_CACHE):
+        self.capacity = capacity
+        self._indexes: OrderedDict[tuple, IdentifierIndex] = OrderedDict()
+        self._building = SingleFlight()
+        self.counters = {"hits": 0, "builds": 0, "symbol_builds": 0, "matches": 0}
+
+    async def get(self, owner: str, repo: str, tree: FileTree, read: Optional[Callable[[str], str]] = None) -> IdentifierIndex:
+        key = (owner, repo, tree.revision, read is not None)
+        if tree.revision is not None and key in self._indexes:
+            self._indexes.move_to_end(key)
+            self.counters["hits"] += 1
+            return self._indexes[key]
+        return await self._building.do(key, lambda: self._build(key, tree, read))
+
+    async def _build(self, key: tuple, tree: FileTree, read: Optional[Callable[[str], str]]) -> IdentifierIndex:
+        index = await asyncio.to_thread(IdentifierIndex, tree, read)
+        self.counters["builds"] += 1
+        self.counters["symbol_builds"] += read is not None
+        if tree.revision is not None:
+            self._indexes[key] = index
+            while len(self._indexes) > self.capacity:
+                self._indexes.popitem(last=False)
+        return index
+
+    def match(self, index: IdentifierIndex, texts: Iterable[str], k: int = ISSUE_RELATED_FILES) -> List[str]:
+        self.counters["matches"] += 1
+        return index.match(extract_references(texts), k)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "cached": len(self._indexes)}
+
+
+issue_matcher = IssueMatcher()
+
+
+if __name__ == "__main__":
+    # Benchmark on a synthetic tree: python -m app.issuematch [files]
+    import sys
+    import time
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 30_000
+    paths = [f"pkg{i % 50}/mod{i % 300}/file_{i}.py" for i in range(n)] + ["src/app/filetree.py", "src/goap/index.py"]
+    tree = FileTree({"path": path, "type": "blob", "size": 100} for path in paths)
+    sources = {"src/app/filetree.py": "class FileTree:\n    def with_extension(self): pass", "src/goap/index.py": "def build_index(x): pass"}
+
+    def read(path: str) -> str:
+        return sources.get(path) or f"def handler_{path.rsplit('_', 1)[-1][:-3]}(): pass"
+
+    issue = [
+        'FileTree breaks\n```\nTraceback (most recent call last):\n'
+        '  File "/home/u/proj/src/goap/index.py", line 10, in build_index\nKeyError\n```',
+        "@x: `with_extension` looks wrong too",
+    ]
+    start = time.perf_counter()
+    index = IdentifierIndex(tree, read)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    related = index.match(extract_references(issue), 5)
+    matched = time.perf_counter() - start
+    print(f"{len(paths)} files, {len(index.symbols)} symbols: build {built:.3f}s, match {matched * 1e3:.3f}ms")
+    print(related)
@@ -0,0 +1,54 @@
+from __future__ import annotations
+import asyncio
+import itertools
+from typing import Iterable
+
+from app.ratelimit import PRIORITY_INTERACTIVE, PRIORITY_NORMAL, request_priority
+from goap.llm import LLM_PRIORITY_BATCH, LLM_PRIORITY_INTERACTIVE, llm_owner, llm_priority
+
+
+class LLMRequestMiddleware:
+    """
+    Tags each HTTP request's LLM and GitHub calls with a priority (interactive
+    paths first) and its LLM calls with an owner id for fair queuing, and cancels the handler when the client
+    disconnects so its queued and running completions are dropped.
+    """
+
+    def __init__(self, app, interactive_paths: Iterable[str] = ("/chat",)):
+        self.app = app
+        self.interactive_paths = tuple(interactive_paths)
+        self._ids = itertools.count()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        interactive = scope["path"].startswith(self.interactive_paths)
+        llm_priority.set(LLM_PRIORITY_INTERACTIVE if interactive else LLM_PRIORITY_BATCH)
+        request_priority.set(PRIORITY_INTERACTIVE if interactive else PRIORITY_NORMAL)
+        llm_owner.set(next(self._ids))
+
+        # we are the only reader of `receive`; the app reads from this queue instead
+        messages: asyncio.Queue = asyncio.Queue()
+        handler = asyncio.ensure_future(self.app(scope, messages.get, send))
+        disconnected = False
+
+        async def watch():
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    disconnected = True
+                    handler.cancel()
+                    return
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if not disconnected:
+                raise  # the server cancelled us, not a disconnect
+        finally:
+            watcher.cancel()
+            handler.cancel()
@@ -0,0 +1,184 @@
+from __future__ import annotations
+from dotenv import load_dotenv
+import os
+import time
+import fcntl
+import shutil
+import tarfile
+import hashlib
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+load_dotenv()
+
+MIRROR_DIR = os.environ.get(
+    "MIRROR_DIR", os.path.join(tempfile.gettempdir(), "gitguru", "mirrors")
+)
+MIRROR_DISK_BYTES = int(os.environ.get("MIRROR_DISK_BYTES", str(10 * 1024 * 1024 * 1024)))
+# Minimum seconds between fetches when a moving ref (branch, HEAD) is requested
+MIRROR_FETCH_INTERVAL = float(os.environ.get("MIRROR_FETCH_INTERVAL", "60"))
+
+
+def _git(*args: str, cwd: Optional[str] = None) -> str:
+    result = subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True)
+    return result.stdout.strip()
+
+
+def _check_rev(rev: str):
+    # git would read a leading "-" as an option
+    if not rev or rev.startswith("-"):
+        raise ValueError(f"Invalid revision: {rev!r}")
+
+
+@contextmanager
+def _locked(path: str, mode: int) -> Iterator[None]:
+    with open(path, "a") as lock:
+        fcntl.flock(lock, mode)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class MirrorCache:
+    """
+    Bare `git clone --mirror` copies kept per repository and refreshed with
+    incremental fetches. Jobs get disposable worktrees (or sparse exports) at a
+    commit instead of cloning. Mirrors are locked against concurrent clones and
+    evicted least-recently-used to fit the disk budget.
+    """
+
+    def __init__(self, root: str = MIRROR_DIR, max_bytes: int = MIRROR_DISK_BYTES, fetch_interval: float = MIRROR_FETCH_INTERVAL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.fetch_interval = fetch_interval
+        self.worktrees = os.path.join(root, "worktrees")
+        os.makedirs(self.worktrees, exist_ok=True)
+
+    @staticmethod
+    def _key(url: str) -> str:
+        name = url.rstrip("/").rsplit("/", 1)[-1].removesuffix(".git") or "repo"
+        return f"{name}-{hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]}"
+
+    def _paths(self, url: str) -> tuple[str, str]:
+        key = self._key(url)
+        return os.path.join(self.root, key + ".git"), os.path.join(self.root, key + ".lock")
+
+    def _has_commit(self, mirror: str, rev: str) -> bool:
+        try:
+            _git("cat-file", "-e", f"{rev}^{{commit}}", cwd=mirror)
+            return True
+        except subprocess.CalledProcessError:
+            return False
+
+    def mirror(self, url: str, rev: str = "HEAD") -> str:
+        """Return a mirror path that contains `rev`, cloning or fetching as needed."""
+        _check_rev(rev)
+        mirror, lock = self._paths(url)
+        stamp = os.path.join(mirror, "FETCH_STAMP")
+        # the common case, a fresh mirror, only needs the shared lock that checkouts hold too
+        with _locked(lock, fcntl.LOCK_SH):
+            if os.path.isdir(mirror) and self._fresh_enough(mirror, stamp, rev):
+                os.utime(mirror)  # LRU clock
+                return mirror
+        with _locked(lock, fcntl.LOCK_EX):
+            if not os.path.isdir(mirror):
+                tmp = tempfile.mkdtemp(dir=self.root, prefix=".clone-")
+                try:
+                    _git("clone", "--mirror", "--quiet", url, tmp)
+                    os.replace(tmp, mirror)
+                except BaseException:
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    raise
+                open(stamp, "w").close()
+            elif not self._fresh_enough(mirror, stamp, rev):  # another job may have fetched meanwhile
+                _git("fetch", "--prune", "--quiet", "origin", cwd=mirror)
+                open(stamp, "w").close()
+            os.utime(mirror)  # LRU clock
+        return mirror
+
+    def _fresh_enough(self, mirror: str, stamp: str, rev: str) -> bool:
+        # a full SHA never moves; anything else is re-fetched after fetch_interval
+        is_sha = len(rev) == 40 and all(c in "0123456789abcdef" for c in rev.lower())
+        if is_sha:
+            return self._has_commit(mirror, rev)
+        try:
+            return time.time() - os.path.getmtime(stamp) < self.fetch_interval
+        except FileNotFoundError:
+            return False
+
+    @contextmanager
+    def checkout(self, url: str, rev: str = "HEAD", paths: Optional[List[str]] = None) -> Iterator[str]:
+        """
+        Yield a directory with the tree at `rev`. Without `paths` this is a detached
+        worktree of the mirror; with `paths` only those files/directories are exported.
+        The directory is removed on exit.
+        """
+        _check_rev(rev)
+        _, lock = self._paths(url)
+        while True:
+            mirror = self.mirror(url, rev)
+            # shared lock keeps eviction away while the checkout is in use
+            with _locked(lock, fcntl.LOCK_SH):
+                if not os.path.isdir(mirror):
+                    continue  # evicted between fetch and lock; fetch again
+                sha = _git("rev-parse", f"{rev}^{{commit}}", cwd=mirror)
+                target = tempfile.mkdtemp(dir=self.worktrees, prefix=self._key(url) + "-")
+                try:
+                    if paths:
+                        archive = subprocess.Popen(["git", "archive", sha, "--", *paths], cwd=mirror, stdout=subprocess.PIPE)
+                        with tarfile.open(fileobj=archive.stdout, mode="r|") as tar:
+                            tar.extractall(target, filter="data")
+                        if archive.wait() != 0:
+                            raise subprocess.CalledProcessError(archive.returncode, "git archive")
+                    else:
+                        with _locked(lock + ".worktree", fcntl.LOCK_EX):
+                            _git("worktree", "add", "--detach", "--force", target, sha, cwd=mirror)
+                    yield target
+                finally:
+                    if not paths:
+                        with _locked(lock + ".worktree", fcntl.LOCK_EX):
+                            subprocess.run(["git", "worktree", "remove", "--force", target], cwd=mirror, capture_output=True)
+                            subprocess.run(["git", "worktree", "prune"], cwd=mirror, capture_output=True)
+                    shutil.rmtree(target, ignore_errors=True)
+            break
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used mirrors that aren't in use until under max_bytes."""
+        mirrors = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith(".git") and os.path.isdir(path):
+                mirrors.append((os.path.getmtime(path), path, _dir_size(path)))
+        total = sum(size for _, _, size in mirrors)
+        for _, path, size in sorted(mirrors):
+            if total <= self.max_bytes:
+                break
+            lock = path.removesuffix(".git") + ".lock"
+            with open(lock, "a") as handle:
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # busy: being fetched or checked out
+                try:
+                    shutil.rmtree(path, ignore_errors=True)
+                    total -= size
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+mirror_cache = MirrorCache()
@@ -0,0 +1,105 @@
+from __future__ import annotations
+from dotenv import load_dotenv
+import os
+import re
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.filetree import FileTree
+from app.singleflight import SingleFlight
+from goap.index import IndexStore, normalize
+from goap.llm import Embeddings, memDB
+from goap.retrieval import RETRIEVAL_INDEX_CACHE, RETRIEVAL_PREFILTER, BM25Index, rrf
+
+load_dotenv()
+
+PATH_INDEX_BACKEND = os.environ.get("PATH_INDEX_BACKEND", "auto")
+
+
+class PathIndex:
+    """
+    Embeddings of a repository's file paths, saved per (repo, tree revision) in an
+    IndexStore. A new revision starts from the latest saved one for the repo:
+    vectors of paths that still exist are copied over and only added paths are
+    embedded, so a known repo costs one query embedding per search. Older
+    revisions are pruned from the store after each build. The BM25
+    index over the same paths is built once per revision and kept alongside.
+    """
+
+    def __init__(self, embeddings: Embeddings, store: Optional[IndexStore] = None, backend: str = PATH_INDEX_BACKEND):
+        self.embeddings = embeddings
+        self.store = store or IndexStore()
+        self.backend = backend
+        self.name = "paths-" + re.sub(r"[^\w.-]", "_", embeddings.model)
+        self._building = SingleFlight()
+        self._lexical: OrderedDict[tuple, BM25Index] = OrderedDict()
+        self.counters = {"hits": 0, "builds": 0, "incremental_builds": 0, "embedded": 0, "reused": 0}
+
+    async def get(self, owner: str, repo: str, tree: FileTree) -> memDB:
+        if tree.revision is None:
+            return await self._build(tree.files(), None)  # nothing to key it by; not saved
+        key = f"{owner}/{repo}"
+        db = await asyncio.to_thread(self.store.get, key, tree.revision, self.name)
+        if db is not None:
+            self.counters["hits"] += 1
+            return db
+        return await self._building.do((key, tree.revision), lambda: self._update(key, tree))
+
+    async def _update(self, key: str, tree: FileTree) -> memDB:
+        previous = await asyncio.to_thread(self.store.latest, key, self.name)
+        db = await self._build(tree.files(), previous[1] if previous else None)
+        await asyncio.to_thread(self.store.put, key, tree.revision, self.name, db)
+        # every head move saves a full copy; drop the superseded ones
+        await asyncio.to_thread(self.store.prune, key, self.name)
+        return db
+
+    async def _build(self, paths: List[str], previous: Optional[memDB]) -> memDB:
+        known = {path: i for i, path in enumerate(previous.items)} if previous is not None and len(previous) else {}
+        reused = [path for path in paths if path in known]
+        added = [path for path in paths if path not in known]
+        vecs = []
+        if reused:
+            vecs.append(previous.index.vectors([known[path] for path in reused]))
+        if added:
+            vecs.append(normalize(await self.embeddings.gen(added)))
+
+        db = memDB(backend=self.backend)
+        if vecs:
+            db.extend(reused + added, np.concatenate(vecs))
+        self.counters["builds"] += 1
+        self.counters["incremental_builds"] += bool(reused)
+        self.counters["embedded"] += len(added)
+        self.counters["reused"] += len(reused)
+        return db
+
+    async def search(self, owner: str, repo: str, tree: FileTree, query: str, k: int = 10) -> List[str]:
+        """Paths ranked for `query`: the saved vector index fused with BM25 over the paths (RRF)."""
+        db = await self.get(owner, repo, tree)
+        if not len(db):
+            return []
+        query_vec = (await self.embeddings.gen([query]))[0]
+        semantic = db.search(query_vec, RETRIEVAL_PREFILTER)
+        index = await self.lexical(owner, repo, tree, db)
+        lexical = [db.items[i] for i in index.top(query, RETRIEVAL_PREFILTER)]
+        return rrf(lexical, semantic)[:k]
+
+    async def lexical(self, owner: str, repo: str, tree: FileTree, db: memDB) -> BM25Index:
+        """BM25 over the paths of `db`, built in a worker thread once per tree revision."""
+        if tree.revision is None:
+            return await asyncio.to_thread(BM25Index, db.items)
+        key = (f"{owner}/{repo}", tree.revision)
+        index = self._lexical.get(key)
+        if index is not None:
+            self._lexical.move_to_end(key)
+            return index
+        index = await self._building.do(("bm25",) + key, lambda: asyncio.to_thread(BM25Index, db.items))
+        self._lexical[key] = index
+        while len(self._lexical) > RETRIEVAL_INDEX_CACHE:
+            self._lexical.popitem(last=False)
+        return index
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "lexical_indexes": len(self._lexical)}
@@ -0,0 +1,214 @@
+from __future__ import annotations
+from dotenv import load_dotenv
+import os
+import time
+import heapq
+import hashlib
+import random
+import asyncio
+import itertools
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+load_dotenv()
+
+# Lower value = served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+
+GITHUB_MAX_RETRIES = int(os.environ.get("GITHUB_MAX_RETRIES", "5"))
+# Fraction of each token's quota held back from lower-priority work
+GITHUB_QUOTA_RESERVE = float(os.environ.get("GITHUB_QUOTA_RESERVE", "0.05"))
+GITHUB_BACKOFF_MAX = 60.0
+
+request_priority: ContextVar[int] = ContextVar("request_priority", default=PRIORITY_NORMAL)
+
+
+class TokenBudget:
+    """Rate-limit state of one token, tracked per GitHub resource (core, graphql, ...)."""
+
+    def __init__(self, token: str):
+        self.token = token
+        self.resources: Dict[str, Dict[str, float]] = {}
+        self.inflight = 0
+        self.blocked_until = 0.0
+
+    def resource(self, name: str) -> Dict[str, float]:
+        if name not in self.resources:
+            self.resources[name] = {"limit": 5000, "remaining": 5000, "reset": 0.0}
+        return self.resources[name]
+
+    def headroom(self, name: str, now: float) -> float:
+        budget = self.resource(name)
+        remaining = budget["limit"] if now >= budget["reset"] else budget["remaining"]
+        return remaining - self.inflight
+
+    def ready_at(self, name: str, now: float, reserve: float) -> float:
+        """Earliest time this token can serve a request that needs `reserve` headroom."""
+        at = self.blocked_until
+        if self.headroom(name, now) <= reserve:
+            at = max(at, self.resource(name)["reset"])
+        return at
+
+
+class GitHubScheduler:
+    """
+    Spreads GitHub requests over a pool of tokens using the X-RateLimit-* headers.
+    Requests wait (highest priority first) instead of failing when quota runs out,
+    and secondary/abuse limits are retried with backoff.
+    """
+
+    def __init__(self, tokens: List[str], reserve: float = GITHUB_QUOTA_RESERVE, max_retries: int = GITHUB_MAX_RETRIES):
+        self.budgets = [TokenBudget(t) for t in dict.fromkeys(tokens) if t]
+        if not self.budgets:
+            raise ValueError("GitHubScheduler needs at least one token")
+        self.reserve = reserve
+        self.max_retries = max_retries
+        self._waiters: List[list] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.counters = {
+            "requests": 0,
+            "waited": 0,
+            "wait_seconds": 0.0,
+            "retries": 0,
+            "secondary_limits": 0,
+            "exhausted": 0,
+        }
+
+    def fingerprint(self) -> str:
+        """Stable digest of the token pool, used to scope cached responses to these credentials."""
+        digest = hashlib.sha256("\0".join(sorted(b.token for b in self.budgets)).encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def _threshold(self, budget: TokenBudget, resource: str, priority: int) -> float:
+        return budget.resource(resource)["limit"] * self.reserve * priority
+
+    def _pick(self, resource: str, priority: int, now: float) -> Optional[TokenBudget]:
+        best, best_headroom = None, 0.0
+        for budget in self.budgets:
+            if budget.blocked_until > now:
+                continue
+            headroom = budget.headroom(resource, now) - self._threshold(budget, resource, priority)
+            if headroom > best_headroom:
+                best, best_headroom = budget, headroom
+        return best
+
+    async def acquire(self, resource: str = "core", priority: Optional[int] = None) -> TokenBudget:
+        priority = request_priority.get() if priority is None else priority
+        self.counters["requests"] += 1
+        if not self._waiters:
+            budget = self._pick(resource, priority, time.time())
+            if budget is not None:
+                budget.inflight += 1
+                return budget
+
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), resource, future]
+        heapq.heappush(self._waiters, entry)
+        self.counters["waited"] += 1
+        self._wake()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(future.result())
+            entry[3] = None
+            raise
+        finally:
+            self.counters["wait_seconds"] += time.monotonic() - start
+
+    def release(self, budget: TokenBudget):
+        budget.inflight -= 1
+        self._wake()
+
+    def _wake(self):
+        now = time.time()
+        pending = []
+        while self._waiters:
+            entry = heapq.heappop(self._waiters)
+            priority, _, resource, future = entry
+            if future is None or future.done():
+                continue
+            budget = self._pick(resource, priority, now)
+            if budget is None:
+                pending.append(entry)
+                continue
+            budget.inflight += 1
+            future.set_result(budget)
+        for entry in pending:
+            heapq.heappush(self._waiters, entry)
+        self._arm_timer(now)
+
+    def _arm_timer(self, now: float):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        ready = [
+            budget.ready_at(resource, now, self._threshold(budget, resource, priority))
+            for priority, _, resource, future in self._waiters if future is not None
+            for budget in self.budgets
+        ]
+        # waiters blocked only on in-flight requests are woken by release()
+        if ready and min(ready) > now:
+            self._timer = asyncio.get_running_loop().call_later(min(ready) - now + 0.05, self._wake)
+
+    async def observe(self, budget: TokenBudget, resource: str, response, attempt: int) -> Optional[float]:
+        """
+        Record rate-limit headers from a response. Returns a delay before retrying
+        when the request hit a rate limit, or None when the response should be used.
+        """
+        headers = response.headers
+        name = headers.get("X-RateLimit-Resource", resource)
+        state = budget.resource(name)
+        if "X-RateLimit-Remaining" in headers:
+            state["remaining"] = int(headers["X-RateLimit-Remaining"])
+            state["limit"] = int(headers.get("X-RateLimit-Limit", state["limit"]))
+            state["reset"] = float(headers.get("X-RateLimit-Reset", state["reset"]))
+
+        if response.status not in (403, 429) or attempt >= self.max_retries:
+            return None
+
+        now = time.time()
+        if headers.get("X-RateLimit-Remaining") == "0":
+            # primary limit: park this token until reset and retry on another one
+            self.counters["exhausted"] += 1
+            self.counters["retries"] += 1
+            return 0.0
+
+        retry_after = headers.get("Retry-After")
+        if retry_after is None:
+            if response.status == 403 and "rate limit" not in (await response.text()).lower():
+                return None  # a genuine permission error
+            delay = min(GITHUB_BACKOFF_MAX, 2 ** attempt) + random.uniform(0, 1)
+        else:
+            delay = float(retry_after)
+        self.counters["secondary_limits"] += 1
+        self.counters["retries"] += 1
+        budget.blocked_until = max(budget.blocked_until, now + delay)
+        return delay
+
+    def state(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            **self.counters,
+            "queued": sum(1 for entry in self._waiters if entry[3] is not None),
+            "tokens": [
+                {
+                    "token": f"...{budget.token[-4:]}",
+                    "inflight": budget.inflight,
+                    "blocked_for": max(0.0, budget.blocked_until - now),
+                    "resources": {
+                        name: {
+                            "limit": int(state["limit"]),
+                            "remaining": int(state["remaining"]) if now < state["reset"] else int(state["limit"]),
+                            "reset_in": max(0.0, state["reset"] - now),
+                        }
+                        for name, state in budget.resources.items()
+                    },
+                }
+                for budget in self.budgets
+            ],
+        }
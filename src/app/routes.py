@@ -1,7 +1,11 @@
 from fastapi import APIRouter, HTTPException
 from app import models, functions
-from app.dataloaders import IssueManager, analyze_repository, generate_docs_summary, find_issue_context, RepositoryManager
-from app.functions import summarize, extract, select, extract_and_summarize
+from app.dataloaders import inflight, github_scheduler, IssueManager, analyze_repository, generate_docs_summary, find_issue_context, repository_manager
+from app.issuematch import issue_matcher
+from app.functions import summarize, report, summary_messages, extract_messages, extract_and_summarize_messages
+from app.streaming import sse_pipeline, sse_response
+from app.cache import response_cache
+from goap import cluster
 from goap.llm import EvalInjectLLM, Embeddings, SemanticAction, RegexAction
 from sast.semgrep import SemgrepScanner
 from sast.searxng import SearxngSearch
@@ -16,117 +20,190 @@ router = APIRouter()
 llm = functions.llm
 embeddings = functions.embeddings
 
-@router.post("/sum-repo")
-async def get_repo_summary(request: models.RepoRequest):
-    """Generate comprehensive repository summary including structure, docs, and languages"""
-    try:
-        owner, repo, _ = parse_github_url(request.url, request.type)
-        analysis = await analyze_repository(owner, repo)
-        context = f"""
+# Each analysis is split into preparing the final prompt (fetching, retrieval,
+# map/reduce) and the final generation, so the /stream variants can send stage
+# events while preparing and then stream the answer token by token.
+
+async def repo_summary_messages(request: models.RepoRequest):
+    owner, repo, _ = parse_github_url(request.url, request.type)
+    report("fetch", repo=f"{owner}/{repo}")
+    analysis = await analyze_repository(owner, repo)
+    context = f"""
         Repository Structure: {', '.join(analysis['structure'][:10])}... ({len(analysis['structure'])} files total)
         Main Languages: {', '.join(analysis['languages'].keys())}
         Documentation: {len(analysis['documentation'])} files
         """
-        return {"data": await summarize("repository overview", context + analysis["readme"])}
+    report("summarize")
+    return await summary_messages("repository overview", context + analysis["readme"])
+
+async def issue_summary_messages(request: models.RepoRequest):
+    owner, repo, issue_number = parse_github_url(request.url, request.type)
+    if not issue_number:
+        raise ValueError("Invalid issue URL")
+
+    report("fetch", issue=f"{owner}/{repo}#{issue_number}")
+    data = await find_issue_context(owner, repo, int(issue_number))
+    combined = [f"ISSUE DISCUSSION:\n{message}" for message in data["conversation"]] + \
+        [f"RELEVANT CODE:\n{block}" for block in data["code_blocks"][:3]]
+    return await extract_and_summarize_messages(
+        "technical issue context", 
+        combined,
+        "Include reproduction steps, error messages, and proposed solutions"
+    )
+
+async def fixes_messages(request: models.RepoRequest):
+    owner, repo, issue_number = parse_github_url(request.url, request.type)
+    report("fetch", issue=f"{owner}/{repo}#{issue_number}")
+    data = await find_issue_context(owner, repo, int(issue_number))
+
+    if not data["code_blocks"]:
+        return "No code samples found in issue"
+
+    # Files the issue points at directly come first; the saved path index fills the rest
+    tree = data["tree"]
+    top_files = data["related_files"][:3]
+    report("select", candidates=len(tree), related=len(data["related_files"]))
+    if len(top_files) < 3:
+        selected_files = await functions.path_index.search(
+            owner, repo, tree, "\n".join(data["code_blocks"] + ["code files needing fixes"]), k=3,
+        )
+        top_files += [f for f in selected_files if f not in top_files][:3 - len(top_files)]
+
+    # Get actual file contents
+    repo_mgr = repository_manager()
+    report("fetch_files", files=top_files)
+    fetched = await repo_mgr.get_file_contents(owner, repo, top_files)
+    file_contents = [fetched[f].content for f in top_files if fetched[f].content is not None]
+
+    return await extract_messages(
+        "potential code fixes",
+        file_contents + data["code_blocks"],
+        "Suggest concrete code changes with explanations"
+    )
+
+async def instructions_messages(request: models.RepoRequest):
+    owner, repo, _ = parse_github_url(request.url, request.type)
+    report("fetch", repo=f"{owner}/{repo}")
+    docs = await generate_docs_summary(owner, repo)
+    return await extract_messages(
+        "setup and usage instructions", 
+        docs.split("\n\n"),
+        "Include installation, configuration, and basic usage steps"
+    )
+
+async def generate(messages):
+    return messages if isinstance(messages, str) else await llm.gen(messages)
+
+@router.post("/sum-repo")
+async def get_repo_summary(request: models.RepoRequest):
+    """Generate comprehensive repository summary including structure, docs, and languages"""
+    try:
+        return {"data": await generate(await repo_summary_messages(request))}
     except Exception as e:
         raise HTTPException(500, f"Repo analysis failed: {str(e)}")
 
+@router.post("/sum-repo/stream")
+async def stream_repo_summary(request: models.RepoRequest):
+    """/sum-repo as server-sent events"""
+    return sse_response(sse_pipeline(lambda: repo_summary_messages(request), llm.stream))
+
 @router.post("/sum-issue")
 async def get_issue_summary(request: models.RepoRequest):
     """Condense issue thread with code context and related files"""
     try:
-        owner, repo, issue_number = parse_github_url(request.url, request.type)
-        if not issue_number:
-            raise ValueError("Invalid issue URL")
-            
-        data = await find_issue_context(owner, repo, int(issue_number))
-        combined = [
-            "ISSUE DISCUSSION:\n",data["conversation"],
-            "RELEVANT CODE:\n" , data["code_blocks"][:3]
-        ]
-        return {"data": await extract_and_summarize(
-            "technical issue context", 
-            combined,
-            "Include reproduction steps, error messages, and proposed solutions"
-        )}
+        return {"data": await generate(await issue_summary_messages(request))}
     except Exception as e:
         raise HTTPException(500, f"Issue summary failed: {str(e)}")
 
+@router.post("/sum-issue/stream")
+async def stream_issue_summary(request: models.RepoRequest):
+    """/sum-issue as server-sent events"""
+    return sse_response(sse_pipeline(lambda: issue_summary_messages(request), llm.stream))
+
 @router.post("/fixes")
 async def get_fixes(request: models.RepoRequest):
     """Suggest code fixes with file references"""
     try:
-        owner, repo, issue_number = parse_github_url(request.url, request.type)
-        data = await find_issue_context(owner, repo, int(issue_number))
-        
-        if not data["code_blocks"]:
-            return {"data": "No code samples found in issue"}
-            
-        # Get most relevant files for the code samples
-        selected_files = await select(
-            data["related_files"], data["code_blocks"], "code files needing fixes",
-        )
-        
-        # Get actual file contents
-        repo_mgr = RepositoryManager()
-        file_contents = await asyncio.gather(*[
-            repo_mgr.get_file_content(owner, repo, f)
-            for f in selected_files[:3]  # Top 3 files
-        ])
-        
-        return {"data": await extract(
-            "potential code fixes",
-            file_contents + data["code_blocks"],
-            "Suggest concrete code changes with explanations"
-        )}
+        return {"data": await generate(await fixes_messages(request))}
     except Exception as e:
         raise HTTPException(500, f"Fix generation failed: {str(e)}")
 
+@router.post("/fixes/stream")
+async def stream_fixes(request: models.RepoRequest):
+    """/fixes as server-sent events"""
+    return sse_response(sse_pipeline(lambda: fixes_messages(request), llm.stream))
+
 @router.post("/instructions")
 async def instructions(request: models.RepoRequest):
     """Generate setup/contribution instructions from docs"""
     try:
-        owner, repo, _ = parse_github_url(request.url, request.type)
-        docs = await generate_docs_summary(owner, repo)
-        return {"data": await extract(
-            "setup and usage instructions", 
-            docs.split("\n\n"),
-            "Include installation, configuration, and basic usage steps"
-        )}
+        return {"data": await generate(await instructions_messages(request))}
     except Exception as e:
         raise HTTPException(500, f"Instruction extraction failed: {str(e)}")
 
+@router.post("/instructions/stream")
+async def stream_instructions(request: models.RepoRequest):
+    """/instructions as server-sent events"""
+    return sse_response(sse_pipeline(lambda: instructions_messages(request), llm.stream))
+
+async def chat_messages(request: models.RepoRequest):
+    owner, repo, issue_number = parse_github_url(request.url, request.type)
+    context = ""
+
+    # @SemanticAction("search", query="search, research, look it up", embeddings=embeddings)
+    # async def search(query: str):
+    #     """Web search integration"""
+    #     return "\n".join([
+    #         f"{r['title']}: {r['snippet']}"
+    #         for r in await SearxngSearch(f"{repo} how to fix {IssueManager().get_issue(owner, repo, issue_number)}")
+    #     ])
+
+    # @SemanticAction("docs", query="documentation, readme", embeddings=embeddings)
+    # async def get_docs(query: str):
+    #     """Repo documentation lookup"""
+    #     return await summarize("documentation", await generate_docs_summary(owner, repo))
+
+    if issue_number:
+        report("fetch", issue=f"{owner}/{repo}#{issue_number}")
+        issue_data = await find_issue_context(owner, repo, int(issue_number))
+        report("summarize")
+        conversation = "\n\n".join(issue_data["conversation"])
+        context += f"\nISSUE CONTEXT:\n{await summarize('active issue', conversation)}"
+    return [{
+        "role": "user",
+        "content": f"{request}\n\nREPO CONTEXT:{context}"
+    }]
+
 @router.post("/chat")
 async def chat(request: models.RepoRequest):
     """AI assistant with repo-aware knowledge"""
     try:
-        owner, repo, issue_number = parse_github_url(request.url, request.type)
-        context = ""
-
-        # @SemanticAction("search", query="search, research, look it up", embeddings=embeddings)
-        # async def search(query: str):
-        #     """Web search integration"""
-        #     return "\n".join([
-        #         f"{r['title']}: {r['snippet']}"
-        #         for r in await SearxngSearch(f"{repo} how to fix {IssueManager().get_issue(owner, repo, issue_number)}")
-        #     ])
-
-        # @SemanticAction("docs", query="documentation, readme", embeddings=embeddings)
-        # async def get_docs(query: str):
-        #     """Repo documentation lookup"""
-        #     return await summarize("documentation", await generate_docs_summary(owner, repo))
-
-        # if issue_number:
-        #     issue_data = await find_issue_context(owner, repo, int(issue_number))
-        #     context += f"\nISSUE CONTEXT:\n{await summarize('active issue', issue_data['conversation'])}"
-
-        # return {"data": await llm.gen([{
-        #     "role": "user",
-        #     "content": f"{request}\n\nREPO CONTEXT:{context}"
-        # }])}
+        return {"data": await generate(await chat_messages(request))}
     except Exception as e:
         raise HTTPException(500, f"Chat failed: {str(e)}")
 
+@router.post("/chat/stream")
+async def stream_chat(request: models.RepoRequest):
+    """/chat as server-sent events, streamed through gen_with_evalinject"""
+    return sse_response(sse_pipeline(lambda: chat_messages(request), lambda messages: llm.gen_with_evalinject(messages, [])))
+
+@router.get("/stats")
+async def stats():
+    """Cache and quota counters"""
+    return {
+        "github_cache": response_cache.stats(),
+        "github_inflight": inflight.stats(),
+        "github_ratelimit": github_scheduler().state(),
+        "embedding_cache": embeddings.cache.stats(),
+        "embedding_batches": embeddings.dispatcher.stats(),
+        "completion_cache": llm.cache.stats() if llm.cache else None,
+        "llm_scheduler": llm.scheduler.stats(),
+        "evalinject_actions": llm.eval_stats(),
+        "clustering": cluster.stats(),
+        "path_index": functions.path_index.stats(),
+        "issue_index": issue_matcher.stats(),
+    }
+
 def parse_github_url(url: str, type: str) -> Tuple[str, str, int]:
 
     parsed_url = urlparse(url)
@@ -0,0 +1,68 @@
+from __future__ import annotations
+from dotenv import load_dotenv
+import os
+import aiohttp
+import asyncio
+from typing import Optional
+
+load_dotenv()
+
+# Connection pool tuning
+HTTP_POOL_LIMIT = int(os.environ.get("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.environ.get("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_DNS_TTL = int(os.environ.get("HTTP_DNS_TTL", "300"))
+HTTP_KEEPALIVE = float(os.environ.get("HTTP_KEEPALIVE", "30"))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "60"))
+
+
+class SessionPool:
+    """
+    Process-wide aiohttp session shared by every outbound HTTP client.
+    Started and closed with the FastAPI app; lazily started for scripts.
+    """
+
+    def __init__(
+        self,
+        limit: int = HTTP_POOL_LIMIT,
+        limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+        dns_ttl: int = HTTP_DNS_TTL,
+        keepalive: float = HTTP_KEEPALIVE,
+        timeout: float = HTTP_TIMEOUT,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> aiohttp.ClientSession:
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    use_dns_cache=True,
+                    ttl_dns_cache=self.dns_ttl,
+                    keepalive_timeout=self.keepalive,
+                )
+                self._session = aiohttp.ClientSession(
+                    connector=connector,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout),
+                )
+            return self._session
+
+    async def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            return await self.start()
+        return self._session
+
+    async def close(self):
+        async with self._lock:
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+            self._session = None
+
+
+pool = SessionPool()
@@ -0,0 +1,369 @@
+from __future__ import annotations
+from dotenv import load_dotenv
+import os
+import io
+import json
+import mmap
+import time
+import queue
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import threading
+import asyncio
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from app.dataloaders import GITHUB_API_URL, FileContent, RepositoryManager
+from app.filetree import FileTree
+from app.singleflight import SingleFlight
+
+load_dotenv()
+
+SNAPSHOT_DIR = os.environ.get(
+    "SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "gitguru", "snapshots")
+)
+SNAPSHOT_DISK_BYTES = int(os.environ.get("SNAPSHOT_DISK_BYTES", str(4 * 1024 * 1024 * 1024)))
+SNAPSHOT_MANIFESTS_IN_MEMORY = 32
+
+
+class SnapshotStore:
+    """
+    Content-addressed store of extracted repository tarballs.
+    Blobs live once under objects/<sha256>; each commit gets a manifest mapping
+    paths to blob digests. Whole snapshots are evicted LRU to fit the disk budget.
+    """
+
+    def __init__(self, root: str = SNAPSHOT_DIR, max_bytes: int = SNAPSHOT_DISK_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects = os.path.join(root, "objects")
+        self.manifests = os.path.join(root, "manifests")
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.manifests, exist_ok=True)
+        self._loaded: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._pins: Dict[str, int] = {}
+        self._lock = threading.Lock()  # one eviction at a time
+        # guards _loaded and _pins, which ingest and evict touch from worker threads;
+        # held while a manifest is loaded or removed so neither sees the other half-done
+        self._state = threading.Lock()
+
+    @staticmethod
+    def _id(owner: str, repo: str, sha: str) -> str:
+        return f"{owner}__{repo}__{sha}"
+
+    def _manifest_path(self, snapshot_id: str) -> str:
+        return os.path.join(self.manifests, snapshot_id + ".json")
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects, digest[:2], digest[2:])
+
+    def manifest(self, owner: str, repo: str, sha: str) -> Optional[Dict[str, Any]]:
+        snapshot_id = self._id(owner, repo, sha)
+        with self._state:
+            manifest = self._loaded.get(snapshot_id)
+            if manifest is not None:
+                self._loaded.move_to_end(snapshot_id)
+        if manifest is None:
+            # parse outside the lock: big repos have manifests of many MB
+            try:
+                with open(self._manifest_path(snapshot_id)) as file:
+                    manifest = json.load(file)
+            except FileNotFoundError:
+                return None
+            with self._state:
+                self._remember(snapshot_id, manifest)
+        self._touch(snapshot_id)
+        return manifest
+
+    def _remember(self, snapshot_id: str, manifest: Dict[str, Any]):
+        self._loaded[snapshot_id] = manifest
+        while len(self._loaded) > SNAPSHOT_MANIFESTS_IN_MEMORY:
+            self._loaded.popitem(last=False)
+
+    @contextmanager
+    def pinned(self, manifest: Dict[str, Any]) -> Iterator[None]:
+        """Keep evict() away from a snapshot while its blobs are being read."""
+        snapshot_id = self._id(manifest["owner"], manifest["repo"], manifest["sha"])
+        with self._state:
+            self._pins[snapshot_id] = self._pins.get(snapshot_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._state:
+                self._pins[snapshot_id] -= 1
+                if not self._pins[snapshot_id]:
+                    del self._pins[snapshot_id]
+
+    def _touch(self, snapshot_id: str):
+        # manifest mtime doubles as the LRU clock; don't hit the disk on every read
+        path = self._manifest_path(snapshot_id)
+        try:
+            if time.time() - os.path.getmtime(path) > 60:
+                os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def read(self, digest: str) -> str:
+        with open(self._object_path(digest), "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return ""
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped[:].decode("utf-8")
+
+    def ingest(self, owner: str, repo: str, sha: str, fileobj) -> Dict[str, Any]:
+        """Stream-extract a gzipped tarball into the store and write its manifest."""
+        entries = {}
+        with tarfile.open(fileobj=fileobj, mode="r|gz") as tar:
+            for member in tar:
+                # strip GitHub's "<owner>-<repo>-<sha>/" prefix
+                _, _, path = member.name.partition("/")
+                if not path:
+                    continue
+                if member.isdir():
+                    entries[path] = {"type": "tree", "digest": None, "size": 0}
+                elif member.isfile():
+                    digest, size = self._put(tar.extractfile(member))
+                    entries[path] = {"type": "blob", "digest": digest, "size": size}
+                elif member.issym():
+                    digest, size = self._put(io.BytesIO(member.linkname.encode("utf-8")))
+                    entries[path] = {"type": "blob", "digest": digest, "size": size}
+
+        manifest = {"owner": owner, "repo": repo, "sha": sha, "entries": entries}
+        snapshot_id = self._id(owner, repo, sha)
+        tmp_path = f"{self._manifest_path(snapshot_id)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(manifest, file)
+        os.replace(tmp_path, self._manifest_path(snapshot_id))
+        with self._state:
+            self._remember(snapshot_id, manifest)
+        self.evict(keep=snapshot_id)
+        return manifest
+
+    def _put(self, source) -> tuple[str, int]:
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while chunk := source.read(1 << 16):
+                    hasher.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            digest = hasher.hexdigest()
+            path = self._object_path(digest)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest, size
+
+    def evict(self, keep: Optional[str] = None):
+        """
+        Drop least recently used snapshots until the object store fits max_bytes.
+        Snapshots pinned by a reader are kept.
+        """
+        with self._lock:
+            manifests = []
+            for name in os.listdir(self.manifests):
+                if name.endswith(".json"):
+                    path = os.path.join(self.manifests, name)
+                    manifests.append((os.path.getmtime(path), name[:-5]))
+            manifests.sort()
+            referenced = {}
+            for _, snapshot_id in manifests:
+                referenced[snapshot_id] = self._digests(snapshot_id)
+
+            sizes = self._object_sizes()
+            total = sum(sizes.values())
+            for _, snapshot_id in manifests:
+                if total <= self.max_bytes:
+                    break
+                if snapshot_id == keep:
+                    continue
+                with self._state:
+                    if snapshot_id in self._pins:
+                        continue
+                    # once the manifest is gone no reader can load it, so its blobs are safe to drop
+                    os.remove(self._manifest_path(snapshot_id))
+                    self._loaded.pop(snapshot_id, None)
+                dropped = referenced.pop(snapshot_id)
+                still_used = set().union(*referenced.values()) if referenced else set()
+                for digest in dropped - still_used:
+                    if digest in sizes:
+                        os.remove(self._object_path(digest))
+                        total -= sizes.pop(digest)
+
+    def _digests(self, snapshot_id: str) -> set:
+        try:
+            with open(self._manifest_path(snapshot_id)) as file:
+                entries = json.load(file)["entries"]
+        except (FileNotFoundError, json.JSONDecodeError):
+            return set()
+        return {e["digest"] for e in entries.values() if e["digest"]}
+
+    def _object_sizes(self) -> Dict[str, int]:
+        sizes = {}
+        for prefix in os.listdir(self.objects):
+            directory = os.path.join(self.objects, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                sizes[prefix + name] = os.path.getsize(os.path.join(directory, name))
+        return sizes
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        with self._state:
+            self._loaded.clear()
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.manifests, exist_ok=True)
+
+
+class _ChunkReader(io.RawIOBase):
+    """Blocking file-like view over chunks pushed from the event loop."""
+
+    def __init__(self, maxsize: int = 64):
+        self.chunks: queue.Queue = queue.Queue(maxsize)
+        self.buffer = b""
+        self.eof = False
+        self.aborted = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self.buffer and not self.eof:
+            chunk = self.chunks.get()
+            if chunk is None:
+                self.eof = True
+            else:
+                self.buffer = chunk
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
+
+    def feed(self, chunk: Optional[bytes]):
+        # give up once the consumer is gone so the producer never blocks forever
+        while not self.aborted:
+            try:
+                self.chunks.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+
+snapshot_store = SnapshotStore()
+snapshots_inflight = SingleFlight()
+
+
+class SnapshotRepositoryManager(RepositoryManager):
+    """
+    RepositoryManager backed by one tarball download per commit SHA.
+    Tree, readme and file reads are served from the local SnapshotStore.
+    """
+
+    def __init__(self, ref: str = "HEAD", store: SnapshotStore = snapshot_store, api_url: str = GITHUB_API_URL, **kwargs):
+        super().__init__(**kwargs)
+        self.ref = ref
+        self.store = store
+        self.api_url = api_url.rstrip("/")
+
+    async def resolve_sha(self, owner: str, repo: str, ref: Optional[str] = None) -> str:
+        data = await self.fetch(f"{self.api_url}/repos/{owner}/{repo}/commits/{ref or self.ref}")
+        return data["sha"]
+
+    async def snapshot(self, owner: str, repo: str, ref: Optional[str] = None) -> Dict[str, Any]:
+        sha = await self.resolve_sha(owner, repo, ref)
+        manifest = await asyncio.to_thread(self.store.manifest, owner, repo, sha)
+        if manifest is not None:
+            return manifest
+        return await snapshots_inflight.do(
+            (owner, repo, sha), lambda: self._download(owner, repo, sha)
+        )
+
+    async def _download(self, owner: str, repo: str, sha: str) -> Dict[str, Any]:
+        manifest = await asyncio.to_thread(self.store.manifest, owner, repo, sha)
+        if manifest is not None:
+            return manifest
+        reader = _ChunkReader()
+
+        def extract():
+            try:
+                return self.store.ingest(owner, repo, sha, io.BufferedReader(reader, 1 << 16))
+            finally:
+                reader.aborted = True
+
+        extraction = asyncio.ensure_future(asyncio.to_thread(extract))
+        try:
+            async for chunk in self.download(f"{self.api_url}/repos/{owner}/{repo}/tarball/{sha}"):
+                if extraction.done():
+                    break
+                await asyncio.to_thread(reader.feed, chunk)
+        except BaseException:
+            await asyncio.to_thread(reader.feed, None)
+            await asyncio.gather(extraction, return_exceptions=True)
+            raise
+        await asyncio.to_thread(reader.feed, None)
+        return await extraction
+
+    async def get_filetree(self, owner: str, repo: str, branch: Optional[str] = None, lazy: bool = False) -> FileTree:
+        manifest = await self.snapshot(owner, repo, branch)
+        tree = FileTree(
+            {"path": path, "type": e["type"], "size": e["size"]}
+            for path, e in manifest["entries"].items()
+        )
+        tree.revision = manifest["sha"]
+        return tree
+
+    async def local_reader(self, owner: str, repo: str, tree: FileTree) -> Optional[Callable[[str], str]]:
+        if not tree.revision:
+            return None
+        manifest = await asyncio.to_thread(self.store.manifest, owner, repo, tree.revision)
+        if manifest is None:
+            return None
+        def read(path: str) -> str:
+            with self.store.pinned(manifest):
+                return self.store.read(manifest["entries"][path]["digest"])
+
+        return read
+
+    async def get_readme(self, owner: str, repo: str) -> str:
+        manifest = await self.snapshot(owner, repo)
+        candidates = sorted(
+            (p for p, e in manifest["entries"].items()
+             if e["type"] == "blob" and "/" not in p and p.lower().startswith("readme")),
+            key=lambda p: (not p.lower().endswith(".md"), p),
+        )
+        if not candidates:
+            raise FileNotFoundError(f"No README in {owner}/{repo}@{manifest['sha']}")
+        return await self._read(manifest, candidates[0])
+
+    async def get_file_content(self, owner: str, repo: str, path: str) -> str:
+        manifest = await self.snapshot(owner, repo)
+        return await self._read(manifest, path)
+
+    async def iter_file_contents(self, owner: str, repo: str, paths: List[str], ref: Optional[str] = None, **kwargs) -> AsyncIterator[FileContent]:
+        manifest = await self.snapshot(owner, repo, None if ref in (None, "HEAD") else ref)
+        for path in dict.fromkeys(paths):
+            try:
+                yield FileContent(path, await self._read(manifest, path))
+            except Exception as e:
+                yield FileContent(path, error=str(e))
+
+    async def _read(self, manifest: Dict[str, Any], path: str) -> str:
+        entry = manifest["entries"].get(path)
+        if entry is None or entry["type"] != "blob":
+            raise FileNotFoundError(f"{path} not found in {manifest['owner']}/{manifest['repo']}@{manifest['sha']}")
+        with self.store.pinned(manifest):
+            if entry["size"] < 1 << 16:
+                return self.store.read(entry["digest"])
+            return await asyncio.to_thread(self.store.read, entry["digest"])
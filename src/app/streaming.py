@@ -0,0 +1,57 @@
+from __future__ import annotations
+import json
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Union
+
+from fastapi.responses import StreamingResponse
+
+from app.functions import progress
+
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def sse_pipeline(
+    prepare: Callable[[], Awaitable[Union[List[dict], str]]],
+    generate: Callable[[List[dict]], AsyncIterator[str]],
+) -> AsyncIterator[str]:
+    """
+    Run `prepare` (fetching, retrieval, map/reduce) while relaying its progress
+    reports as `stage` events, then stream the final generation as `token` events.
+    `prepare` returns the final messages, or a string to send as the answer as is.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    reset = progress.set(lambda stage, info: queue.put_nowait({"stage": stage, **info}))
+    task = asyncio.ensure_future(prepare())  # the task copies the context, progress included
+    progress.reset(reset)
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while (item := await queue.get()) is not None:
+            yield sse_event("stage", item)
+        try:
+            messages = task.result()
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+            return
+        yield sse_event("stage", {"stage": "generate"})
+        if isinstance(messages, str):
+            yield sse_event("token", messages)
+        else:
+            try:
+                async for token in generate(messages):
+                    yield sse_event("token", token)
+            except Exception as e:
+                yield sse_event("error", {"detail": str(e)})
+                return
+        yield sse_event("done", {})
+    finally:
+        task.cancel()
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
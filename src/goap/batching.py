@@ -0,0 +1,158 @@
+from __future__ import annotations
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from goap.packing import estimate_tokens
+
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "64"))
+# Estimated input tokens per request; a single longer text is still sent, alone
+EMBED_BATCH_TOKENS = int(os.environ.get("EMBED_BATCH_TOKENS", "16384"))
+EMBED_MAX_WAIT = float(os.environ.get("EMBED_MAX_WAIT_MS", "5")) / 1000
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "4"))
+
+
+class EmbeddingDispatcher:
+    """
+    Shared batching front for an embedding endpoint. Texts from all callers are
+    queued, identical texts share one result, and the queue is sent in batches of
+    at most `batch_size` texts and `max_tokens` estimated tokens, with at most
+    `concurrency` requests in flight. A partial batch waits up to `max_wait`
+    seconds for other callers before it is sent.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], Awaitable[List[Any]]],
+        batch_size: int = EMBED_BATCH_SIZE,
+        max_wait: float = EMBED_MAX_WAIT,
+        concurrency: int = EMBED_CONCURRENCY,
+        max_tokens: int = EMBED_BATCH_TOKENS,
+    ):
+        self.embed_fn = embed_fn
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.max_wait = max_wait
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # text -> (future, enqueued_at, estimated tokens), not yet sent
+        self._pending: OrderedDict[str, Tuple[asyncio.Future, float, int]] = OrderedDict()
+        self._pending_tokens = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._active = 0
+        self._busy_since = 0.0
+        self.counters = {"requests": 0, "texts": 0, "deduplicated": 0, "batches": 0, "embedded": 0, "errors": 0}
+        self._busy_seconds = 0.0
+        self._waited = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def embed(self, texts: List[str]) -> List[Any]:
+        check_texts(texts)
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        self.counters["requests"] += 1
+        self.counters["texts"] += len(texts)
+        futures = []
+        for text in texts:
+            future = self._inflight.get(text)
+            if future is None and text in self._pending:
+                future = self._pending[text][0]
+            if future is None:
+                future = loop.create_future()
+                tokens = estimate_tokens(text)
+                self._pending[text] = (future, now, tokens)
+                self._pending_tokens += tokens
+            else:
+                self.counters["deduplicated"] += 1
+            futures.append(future)
+
+        while self._pending and (len(self._pending) >= self.batch_size or self._pending_tokens >= self.max_tokens):
+            self._flush()
+        if self._pending and self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush_all)
+        # shield so a cancelled caller doesn't fail the batch for the others
+        return list(await asyncio.gather(*(asyncio.shield(f) for f in futures)))
+
+    def _flush_all(self):
+        self._timer = None
+        while self._pending:
+            self._flush()
+
+    def _flush(self):
+        batch, tokens = [], 0
+        while self._pending and len(batch) < self.batch_size:
+            text, (future, enqueued_at, size) = next(iter(self._pending.items()))
+            if batch and tokens + size > self.max_tokens:
+                break
+            del self._pending[text]
+            self._pending_tokens -= size
+            tokens += size
+            self._inflight[text] = future
+            batch.append((text, future, enqueued_at))
+        if not self._pending and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future, float]]):
+        async with self._semaphore:
+            started = time.monotonic()
+            self._waited += len(batch)
+            for _, _, enqueued_at in batch:
+                self._wait_total += started - enqueued_at
+                self._wait_max = max(self._wait_max, started - enqueued_at)
+            if self._active == 0:
+                self._busy_since = started
+            self._active += 1
+            self.counters["batches"] += 1
+            try:
+                vecs = await self.embed_fn([text for text, _, _ in batch])
+                if len(vecs) != len(batch):
+                    raise ValueError(f"Embedding server returned {len(vecs)} vectors for {len(batch)} texts")
+            except Exception as e:
+                self.counters["errors"] += 1
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                        future.exception()  # don't warn if every waiter was cancelled
+            except BaseException:
+                for _, future, _ in batch:
+                    future.cancel()
+                raise
+            else:
+                self.counters["embedded"] += len(batch)
+                for (_, future, _), vec in zip(batch, vecs):
+                    if not future.done():
+                        future.set_result(vec)
+            finally:
+                for text, future, _ in batch:
+                    if self._inflight.get(text) is future:
+                        del self._inflight[text]
+                self._active -= 1
+                if self._active == 0:
+                    self._busy_seconds += time.monotonic() - self._busy_since
+
+    def stats(self) -> Dict[str, Any]:
+        busy = self._busy_seconds + (time.monotonic() - self._busy_since if self._active else 0.0)
+        return {
+            **self.counters,
+            "queued": len(self._pending),
+            "inflight": len(self._inflight),
+            "avg_batch_size": self.counters["embedded"] / self.counters["batches"] if self.counters["batches"] else 0.0,
+            "texts_per_second": self.counters["embedded"] / busy if busy else 0.0,
+            "avg_queue_wait_ms": 1000 * self._wait_total / self._waited if self._waited else 0.0,
+            "max_queue_wait_ms": 1000 * self._wait_max,
+        }
+
+
+def check_texts(texts: List[str]):
+    """Embedding inputs are flat lists of strings; anything else would fail deep inside a batch."""
+    for text in texts:
+        if not isinstance(text, str):
+            raise TypeError(f"Embedding inputs must be strings, got {type(text).__name__}: {text!r:.80}")
@@ -0,0 +1,224 @@
+"""
+Micro-benchmarks for the goap hot paths.
+
+    python -m goap.bench memdb --sizes 1000 10000 100000
+    python -m goap.bench bm25 --tokens 1000 5000 20000
+    python -m goap.bench planner --sides 20 40 80 --keys 2 --library 200
+"""
+import argparse
+import heapq
+import time
+from itertools import count
+
+import numpy as np
+import rank_bm25
+
+from goap.bm25 import TermStream, bm25l_score
+from goap.core import Action, AStarPlanner, Goal, State
+from goap.llm import cosine_sim, memDB
+
+
+class LegacyMemDB:
+    """The original np.append / per-row cosine_sim implementation, for comparison."""
+    def __init__(self):
+        self.vecs = None
+        self.items = []
+
+    def add(self, item, vec):
+        self.vecs = np.array([vec]) if self.vecs is None else np.append(self.vecs, [vec], axis=0)
+        self.items.append(item)
+
+    def extend(self, items, vecs):
+        self.vecs = np.array(vecs) if self.vecs is None else np.append(self.vecs, vecs, axis=0)
+        self.items.extend(items)
+
+    def search(self, query_embedding, top_k=5):
+        similarities = [cosine_sim(query_embedding, embedding) for embedding in self.vecs]
+        relevant_indices = np.argsort(similarities)[-top_k:]
+        return [self.items[i] for i in relevant_indices]
+
+
+def timed(fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_memdb(sizes, dim=384, queries=20, top_k=10, max_legacy_adds=10_000):
+    rng = np.random.default_rng(0)
+    print(f"{'n':>8} {'impl':>8} {'add x n':>12} {'search':>12} {'batch/q':>12}")
+    for n in sizes:
+        vecs = rng.standard_normal((n, dim)).astype(np.float32)
+        qs = rng.standard_normal((queries, dim)).astype(np.float32)
+        items = list(range(n))
+
+        db = memDB()
+        add_new = timed(lambda: [db.add(i, v) for i, v in zip(items, vecs)])
+        search_new = timed(lambda: [db.search(q, top_k) for q in qs]) / queries
+        batch_new = timed(lambda: db.search_batch(qs, top_k)) / queries
+        print(f"{n:>8} {'memDB':>8} {add_new:>11.4f}s {search_new * 1e3:>10.3f}ms {batch_new * 1e3:>10.3f}ms")
+
+        legacy = LegacyMemDB()
+        if n <= max_legacy_adds:
+            add_old = f"{timed(lambda: [legacy.add(i, v) for i, v in zip(items, vecs)]):>11.4f}s"
+        else:
+            legacy.extend(items, vecs)
+            add_old = f"{'skipped':>12}"
+        legacy.search(qs[0], top_k)  # numba compile
+        search_old = timed(lambda: [legacy.search(q, top_k) for q in qs[:3]]) / 3
+        print(f"{n:>8} {'legacy':>8} {add_old} {search_old * 1e3:>10.3f}ms {'-':>12}")
+
+        assert set(db.search(qs[0], top_k)) == set(legacy.search(qs[0], top_k))
+
+
+def legacy_bm25_score(text, query_tokens):
+    """The original BM25Action evaluator: a fresh single-document BM25L index per check."""
+    text_tokens = text.lower().split()
+    if not text_tokens:
+        return None
+    return max(rank_bm25.BM25L([text_tokens]).get_scores(query_tokens))
+
+
+def fake_stream(n_tokens, rng, query_tokens):
+    """Generated text cut into chunks that split words and whitespace at random."""
+    vocab = [f"word{i}" for i in range(2000)] + [t.upper() for t in query_tokens] + query_tokens
+    words = rng.choice(vocab, n_tokens)
+    text = "".join(w + rng.choice([" ", "  ", "\n", "\t "]) for w in words)
+    cuts = np.sort(rng.choice(np.arange(1, len(text)), n_tokens - 1, replace=False))
+    return [text[a:b] for a, b in zip(np.r_[0, cuts], np.r_[cuts, len(text)])]
+
+
+def bench_bm25(token_counts, every=8, actions=3, threshold=0.5):
+    rng = np.random.default_rng(0)
+    queries = [["fix", "bug", "error"], ["search", "Docs"], ["stop", "helping"]][:actions]
+    print(f"{'tokens':>8} {'checks':>8} {'legacy':>12} {'TermStream':>12} {'speedup':>8}")
+    for n in token_counts:
+        chunks = fake_stream(n, rng, [t for q in queries for t in q])
+
+        def run_legacy():
+            text, decisions = "", []
+            for i, piece in enumerate(chunks, 1):
+                text += piece
+                if i % every == 0:
+                    decisions.append([legacy_bm25_score(text, q) for q in queries])
+            return decisions
+
+        def run_stream():
+            text, decisions, terms = "", [], TermStream()
+            for i, piece in enumerate(chunks, 1):
+                text += piece
+                if i % every == 0:
+                    terms.sync(text)
+                    decisions.append([bm25l_score(terms, q) if len(terms) else None for q in queries])
+            return decisions
+
+        start = time.perf_counter()
+        legacy = run_legacy()
+        legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        stream = run_stream()
+        stream_time = time.perf_counter() - start
+        assert legacy == stream, "TermStream scores differ from rank_bm25"
+        assert [[s is not None and s > threshold for s in row] for row in legacy] == \
+               [[s is not None and s > threshold for s in row] for row in stream]
+        print(f"{n:>8} {len(legacy):>8} {legacy_time:>11.4f}s {stream_time:>11.4f}s {legacy_time / stream_time:>7.0f}x")
+
+
+class LegacyAStarPlanner:
+    """
+    The original AStarPlanner.plan: sorted-tuple state keys built twice per
+    expansion, a plan list copied on every push and full State dicts in the heap.
+    A tie counter is added; without it equal (f, g) entries compare States and raise.
+    """
+    def plan(self, current_state, goals, actions):
+        target_goal = next((goal for goal in goals if not goal.evaluate(current_state)), None)
+        if target_goal is None:
+            return []
+        tie = count()
+        open_set = [(target_goal.goal_distance(current_state), 0, next(tie), current_state.substate(), [])]
+        closed_set = set()
+        while open_set:
+            f, g, _, state, plan = heapq.heappop(open_set)
+            state_key = tuple(sorted(state.items()))
+            if state_key in closed_set:
+                continue
+            closed_set.add(state_key)
+            if target_goal.evaluate(state):
+                return plan
+            for action in actions:
+                if action.will_run_given(state):
+                    new_state = action.test(state)
+                    new_plan = plan + [action]
+                    new_g = g + 1
+                    if tuple(sorted(new_state.items())) in closed_set:
+                        continue
+                    heapq.heappush(open_set, (new_g + target_goal.goal_distance(new_state), new_g, next(tie), new_state, new_plan))
+        return []
+
+
+def counter_domain(keys, side, library=0):
+    """
+    `keys` counters in [0, side) with +1/-1 actions each: side ** keys reachable states.
+    `library` extra actions are guarded by flags the plan never changes, like the
+    unrelated tools of a large agent.
+    """
+    actions = []
+    for i in range(library):
+        flag = f"flag{i % 64}"
+        tool = Action(f"tool{i}")
+        tool.precondition(flag)(lambda v: v > 0)
+        tool.affects(flag)(lambda v: v - 1)
+        actions.append(tool)
+    for k in range(keys):
+        key = f"k{k}"
+        up, down = Action(f"{key}+1"), Action(f"{key}-1")
+        up.precondition(key)(lambda v: v < side - 1)
+        up.affects(key)(lambda v: v + 1)
+        down.precondition(key)(lambda v: v > 0)
+        down.affects(key)(lambda v: v - 1)
+        actions += [up, down]
+    flags = {f"flag{i % 64}": 0 for i in range(library)}
+    start = State(**{f"k{k}": 0 for k in range(keys)}, **flags)
+    # the default metric (1 per unmet key) is a weak heuristic, so most of the space gets expanded
+    goal = Goal("far corner", **{f"k{k}": side - 1 for k in range(keys)}, **flags)
+    return start, [goal], actions
+
+
+def bench_planner(sides, keys=2, library=0):
+    print(f"{'states':>8} {'keys':>5} {'actions':>8} {'legacy':>12} {'compact':>12} {'speedup':>8} {'plan':>6}")
+    for side in sides:
+        start, goals, actions = counter_domain(keys, side, library)
+        started = time.perf_counter()
+        legacy = LegacyAStarPlanner().plan(start, goals, actions)
+        legacy_time = time.perf_counter() - started
+        started = time.perf_counter()
+        compact = AStarPlanner("bench").plan(start, goals, actions)
+        compact_time = time.perf_counter() - started
+        assert len(legacy) == len(compact) == keys * (side - 1), "plans differ in cost"
+        print(f"{side ** keys:>8} {keys:>5} {len(actions):>8} {legacy_time:>11.4f}s {compact_time:>11.4f}s "
+              f"{legacy_time / compact_time:>7.1f}x {len(compact):>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="goap micro-benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+    memdb_parser = sub.add_parser("memdb", help="memDB insert and search latency")
+    memdb_parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    memdb_parser.add_argument("--dim", type=int, default=384)
+    memdb_parser.add_argument("--queries", type=int, default=20)
+    bm25_parser = sub.add_parser("bm25", help="BM25Action evaluation over a long streamed generation")
+    bm25_parser.add_argument("--tokens", type=int, nargs="+", default=[1_000, 5_000, 20_000])
+    bm25_parser.add_argument("--every", type=int, default=8, help="evaluate every N chunks")
+    planner_parser = sub.add_parser("planner", help="AStarPlanner on synthetic counter domains")
+    planner_parser.add_argument("--sides", type=int, nargs="+", default=[20, 40, 80])
+    planner_parser.add_argument("--keys", type=int, default=2)
+    planner_parser.add_argument("--library", type=int, default=0, help="extra actions that never apply")
+    args = parser.parse_args()
+
+    if args.bench == "memdb":
+        bench_memdb(args.sizes, args.dim, args.queries)
+    elif args.bench == "bm25":
+        bench_bm25(args.tokens, args.every)
+    elif args.bench == "planner":
+        bench_planner(args.sides, args.keys, args.library)
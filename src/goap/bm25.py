@@ -0,0 +1,63 @@
+from __future__ import annotations
+import math
+from typing import Dict, Iterable
+
+# rank_bm25.BM25L defaults
+BM25L_K1 = 1.5
+BM25L_DELTA = 0.5
+# idf of a term that occurs in the only document: log(N + 1) - log(n + 0.5) with N = n = 1
+SINGLE_DOC_IDF = math.log(2) - math.log(1.5)
+
+
+class TermStream:
+    """
+    Running term frequencies of a streamed text, tokenized like `text.lower().split()`.
+    The trailing token may still grow, so it is held back and counted provisionally.
+    Several BM25 actions can share one stream; `sync` consumes only unseen text.
+    """
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.tokens = 0
+        self.offset = 0
+        self._carry = ""
+        self._carry_lower = ""
+
+    def __len__(self) -> int:
+        return self.tokens + (1 if self._carry else 0)
+
+    def sync(self, text: str):
+        """Consume whatever `text` adds beyond what was already seen (text must only grow)."""
+        if len(text) > self.offset:
+            self.feed(text[self.offset:])
+
+    def feed(self, delta: str):
+        self.offset += len(delta)
+        buf = self._carry + delta
+        tokens = buf.split()
+        if tokens and not buf[-1].isspace():
+            self._carry = tokens.pop()
+            self._carry_lower = self._carry.lower()
+        else:
+            self._carry = self._carry_lower = ""
+        for token in tokens:
+            token = token.lower()
+            self.counts[token] = self.counts.get(token, 0) + 1
+        self.tokens += len(tokens)
+
+    def tf(self, term: str) -> int:
+        return self.counts.get(term, 0) + (term == self._carry_lower and self._carry != "")
+
+
+def bm25l_score(terms: TermStream, query_tokens: Iterable[str], k1: float = BM25L_K1, delta: float = BM25L_DELTA) -> float:
+    """
+    Score of the stream as the single document of a BM25L index, identical to
+    `rank_bm25.BM25L([tokens]).get_scores(query_tokens)[0]`, in O(len(query_tokens)).
+    With one document its length equals the average, so ctd is just the term frequency.
+    """
+    score = 0.0
+    for term in query_tokens:
+        tf = terms.tf(term)
+        if tf:
+            score += SINGLE_DOC_IDF * tf * (k1 + 1) * (tf + delta) / (k1 + tf + delta)
+    return score
@@ -0,0 +1,251 @@
+from __future__ import annotations
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+EMBED_CACHE_PATH = os.environ.get(
+    "EMBED_CACHE_PATH", os.path.join(tempfile.gettempdir(), "gitguru", "embeddings.sqlite3")
+)
+EMBED_CACHE_ENTRIES = int(os.environ.get("EMBED_CACHE_ENTRIES", "50000"))
+COMPLETION_CACHE_PATH = os.environ.get(
+    "COMPLETION_CACHE_PATH", os.path.join(tempfile.gettempdir(), "gitguru", "completions.sqlite3")
+)
+COMPLETION_CACHE_ENTRIES = int(os.environ.get("COMPLETION_CACHE_ENTRIES", "2048"))
+COMPLETION_CACHE_TTL = float(os.environ.get("COMPLETION_CACHE_TTL", "86400"))
+# SQLite caps bound parameters per statement
+_SQL_BATCH = 500
+
+
+class _SQLite:
+    """Per-thread SQLite connections (asyncio.to_thread uses a pool) in WAL mode, shareable across processes."""
+
+    def __init__(self, path: str, schema: str):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(self.schema)
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+
+class EmbeddingCache:
+    """
+    Embeddings keyed by sha256(model, text): an in-process LRU in front of a SQLite
+    table of float16 vectors. SQLite runs in WAL mode so several worker processes
+    can share one file; writes are INSERT OR IGNORE since equal keys hold equal vectors.
+    """
+
+    def __init__(self, path: Optional[str] = EMBED_CACHE_PATH, max_entries: int = EMBED_CACHE_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._memory: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self._db = _SQLite(path, "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vec BLOB NOT NULL) WITHOUT ROWID")
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+
+    @staticmethod
+    def key(model: str, text: str) -> bytes:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+    def _remember(self, key: bytes, vec: np.ndarray):
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _read(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        conn = self._db.conn()
+        found = {}
+        for i in range(0, len(keys), _SQL_BATCH):
+            batch = keys[i:i + _SQL_BATCH]
+            rows = conn.execute(
+                f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float16)
+        return found
+
+    def _write(self, vecs: Dict[bytes, np.ndarray]):
+        conn = self._db.conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vec) VALUES (?, ?)",
+                ((key, vec.tobytes()) for key, vec in vecs.items()),
+            )
+
+    async def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, np.ndarray]:
+        """Cached float16 vectors for whichever of `keys` are known."""
+        found, unknown = {}, []
+        for key in dict.fromkeys(keys):
+            vec = self._memory.get(key)
+            if vec is None:
+                unknown.append(key)
+            else:
+                self._memory.move_to_end(key)
+                found[key] = vec
+        self.counters["hits"] += len(found)
+        loaded = {}
+        if unknown and self.path:
+            loaded = await asyncio.to_thread(self._read, unknown)
+            for key, vec in loaded.items():
+                self._remember(key, vec)
+            found.update(loaded)
+        self.counters["disk_hits"] += len(loaded)
+        self.counters["misses"] += len(unknown) - len(loaded)
+        return found
+
+    async def put_many(self, vecs: Dict[bytes, np.ndarray]) -> Dict[bytes, np.ndarray]:
+        """Store vectors; returns them as stored (float16) so fresh and cached results match."""
+        vecs = {key: np.asarray(vec, dtype=np.float16) for key, vec in vecs.items()}
+        for key, vec in vecs.items():
+            self._remember(key, vec)
+        self.counters["stores"] += len(vecs)
+        if vecs and self.path:
+            await asyncio.to_thread(self._write, vecs)
+        return vecs
+
+    def stats(self) -> Dict:
+        lookups = self.counters["hits"] + self.counters["disk_hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "memory_entries": len(self._memory),
+            "hit_ratio": (self.counters["hits"] + self.counters["disk_hits"]) / lookups if lookups else 0.0,
+        }
+
+
+class CompletionCache:
+    """
+    Chat completions keyed by (model, normalized messages, sampling params), with
+    TTL and LRU eviction in memory and an optional SQLite tier. Concurrent calls
+    for the same key share one in-flight generation.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = COMPLETION_CACHE_PATH,
+        max_entries: int = COMPLETION_CACHE_ENTRIES,
+        ttl: float = COMPLETION_CACHE_TTL,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory: OrderedDict[bytes, Dict[str, Any]] = OrderedDict()
+        self._inflight: Dict[bytes, asyncio.Task] = {}
+        self._db = _SQLite(path, (
+            "CREATE TABLE IF NOT EXISTS completions "
+            "(key BLOB PRIMARY KEY, content TEXT NOT NULL, tokens INTEGER NOT NULL, stored_at REAL NOT NULL) WITHOUT ROWID"
+        )) if path else None
+        self.counters = {"hits": 0, "disk_hits": 0, "shared": 0, "misses": 0, "saved_tokens": 0}
+
+    @staticmethod
+    def key(model: str, messages: List[Dict], params: Dict[str, Any]) -> bytes:
+        normalized = [
+            # only outer whitespace: prompts carry code, where indentation and newlines matter
+            {"role": m.get("role"), "content": str(m.get("content") or "").strip()}
+            for m in messages
+        ]
+        data = json.dumps([model, normalized, params], sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(data.encode("utf-8")).digest()
+
+    def _fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["stored_at"] < self.ttl
+
+    def _remember(self, key: bytes, entry: Dict[str, Any]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _read(self, key: bytes) -> Optional[Dict[str, Any]]:
+        row = self._db.conn().execute(
+            "SELECT content, tokens, stored_at FROM completions WHERE key = ?", (key,)
+        ).fetchone()
+        return None if row is None else {"content": row[0], "tokens": row[1], "stored_at": row[2]}
+
+    def _write(self, key: bytes, entry: Dict[str, Any]):
+        conn = self._db.conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO completions (key, content, tokens, stored_at) VALUES (?, ?, ?, ?)",
+                (key, entry["content"], entry["tokens"], entry["stored_at"]),
+            )
+
+    async def _lookup(self, key: bytes) -> Optional[Dict[str, Any]]:
+        entry = self._memory.get(key)
+        if entry is not None and self._fresh(entry):
+            self._memory.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry
+        if self._db is not None:
+            entry = await asyncio.to_thread(self._read, key)
+            if entry is not None and self._fresh(entry):
+                self._remember(key, entry)
+                self.counters["disk_hits"] += 1
+                return entry
+        return None
+
+    async def _generate(self, key: bytes, fn: Callable[[], Awaitable[Tuple[str, int]]]) -> Dict[str, Any]:
+        self.counters["misses"] += 1
+        content, tokens = await fn()
+        entry = {"content": content, "tokens": tokens, "stored_at": time.time()}
+        self._remember(key, entry)
+        if self._db is not None:
+            await asyncio.to_thread(self._write, key, entry)
+        return entry
+
+    async def get_or_create(self, key: bytes, fn: Callable[[], Awaitable[Tuple[str, int]]]) -> str:
+        """Cached completion for `key`, else the result of `fn()` -> (content, total_tokens)."""
+        task = self._inflight.get(key)
+        if task is None:
+            entry = await self._lookup(key)
+            if entry is not None:
+                self.counters["saved_tokens"] += entry["tokens"]
+                return entry["content"]
+            task = self._inflight.get(key)  # another caller may have started while we read disk
+        if task is None:
+            task = asyncio.ensure_future(self._generate(key, fn))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            # shield so one cancelled caller doesn't cancel the generation for everyone else
+            return (await asyncio.shield(task))["content"]
+        self.counters["shared"] += 1
+        entry = await asyncio.shield(task)
+        self.counters["saved_tokens"] += entry["tokens"]
+        return entry["content"]
+
+    def _forget(self, key: bytes, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["disk_hits"] + self.counters["shared"] + self.counters["misses"]
+        served = lookups - self.counters["misses"]
+        return {
+            **self.counters,
+            "memory_entries": len(self._memory),
+            "inflight": len(self._inflight),
+            "hit_ratio": served / lookups if lookups else 0.0,
+        }
+
+
+embedding_cache = EmbeddingCache()
+completion_cache = CompletionCache()
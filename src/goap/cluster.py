@@ -0,0 +1,133 @@
+from __future__ import annotations
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+import hdbscan
+import numpy as np
+
+# Above this many points HDBSCAN runs on a sample and the rest join the nearest cluster
+CLUSTER_EXACT_MAX = int(os.environ.get("CLUSTER_EXACT_MAX", "5000"))
+CLUSTER_SAMPLE = int(os.environ.get("CLUSTER_SAMPLE", "5000"))
+CLUSTER_CACHE_ENTRIES = int(os.environ.get("CLUSTER_CACHE_ENTRIES", "128"))
+_ASSIGN_BATCH = 8192
+
+_cache: OrderedDict[bytes, np.ndarray] = OrderedDict()
+_cache_lock = threading.Lock()  # cluster_labels runs in worker threads
+counters = {"calls": 0, "cache_hits": 0, "sampled": 0, "assigned_nearest": 0, "resplit": 0}
+
+
+def _key(vecs: np.ndarray, min_s: int, max_s: int) -> bytes:
+    digest = hashlib.sha256(vecs.tobytes())
+    digest.update(f"{vecs.shape}:{min_s}:{max_s}".encode("utf-8"))
+    return digest.digest()
+
+
+def _centroids(vecs: np.ndarray, labels: np.ndarray, n_clusters: int) -> np.ndarray:
+    clustered = labels >= 0
+    sums = np.zeros((n_clusters, vecs.shape[1]), dtype=np.float64)
+    np.add.at(sums, labels[clustered], vecs[clustered])
+    counts = np.bincount(labels[clustered], minlength=n_clusters)
+    return (sums / counts[:, None]).astype(np.float32)
+
+
+def nearest(vecs: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid (L2) for each row, computed in batches."""
+    c_norms = (centroids * centroids).sum(axis=1)
+    out = np.empty(len(vecs), dtype=np.int64)
+    for i in range(0, len(vecs), _ASSIGN_BATCH):
+        batch = vecs[i:i + _ASSIGN_BATCH]
+        # |x - c|^2 = |x|^2 - 2x.c + |c|^2; |x|^2 doesn't change the argmin
+        out[i:i + _ASSIGN_BATCH] = np.argmin(c_norms - 2 * batch @ centroids.T, axis=1)
+    return out
+
+
+def _split_oversized(vecs: np.ndarray, labels: np.ndarray, max_s: int) -> np.ndarray:
+    """
+    Cut clusters larger than `max_s` into equal runs along their principal axis,
+    new pieces taking fresh labels. Assigning noise and unsampled points can push
+    a cluster past the bound HDBSCAN enforced on the points it saw.
+    """
+    sizes = np.bincount(labels)
+    next_label = len(sizes)
+    for label in np.flatnonzero(sizes > max_s):
+        members = np.flatnonzero(labels == label)
+        centered = vecs[members] - vecs[members].mean(axis=0)
+        axis = np.random.default_rng(0).standard_normal(vecs.shape[1]).astype(np.float32)
+        for _ in range(8):  # power iteration for the top principal component
+            axis = centered.T @ (centered @ axis)
+            axis /= np.linalg.norm(axis) or 1.0
+        order = members[np.argsort(centered @ axis, kind="stable")]
+        pieces = np.array_split(order, -(-len(members) // max_s))
+        counters["resplit"] += 1
+        for piece in pieces[1:]:
+            labels[piece] = next_label
+            next_label += 1
+    return labels
+
+
+def cluster_labels(vecs, min_s: int = 2, max_s: int = 1000) -> np.ndarray:
+    """
+    Cluster label per row. Uses HDBSCAN (L2) on all points up to CLUSTER_EXACT_MAX,
+    otherwise on a random sample. Noise and unsampled points are assigned to the
+    nearest cluster centroid, so every point gets a label >= 0; clusters that grow
+    past `max_s` that way are split, so no cluster has more than `max_s` points.
+    The result is cached and shared between callers, so it is read-only.
+    """
+    vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+    counters["calls"] += 1
+    key = _key(vecs, min_s, max_s)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            counters["cache_hits"] += 1
+            return _cache[key]
+
+    n = len(vecs)
+    if n <= max(min_s, 2):
+        labels = np.zeros(n, dtype=np.int64)
+    else:
+        if n > CLUSTER_EXACT_MAX:
+            counters["sampled"] += 1
+            sample = np.random.default_rng(0).choice(n, min(CLUSTER_SAMPLE, n), replace=False)
+        else:
+            sample = np.arange(n)
+        fitted = hdbscan.HDBSCAN(
+            min_samples=min_s, min_cluster_size=min_s, max_cluster_size=max_s, metric="l2"
+        ).fit(vecs[sample]).labels_
+        n_clusters = int(fitted.max()) + 1
+        if n_clusters == 0:
+            labels = np.zeros(n, dtype=np.int64)  # no structure found: one cluster
+        else:
+            labels = np.full(n, -1, dtype=np.int64)
+            labels[sample] = fitted
+            unlabeled = labels < 0
+            counters["assigned_nearest"] += int(unlabeled.sum())
+            labels[unlabeled] = nearest(vecs[unlabeled], _centroids(vecs, labels, n_clusters))
+    if max_s and n > max_s:
+        labels = _split_oversized(vecs, labels, max_s)
+    labels.flags.writeable = False
+
+    with _cache_lock:
+        _cache[key] = labels
+        while len(_cache) > CLUSTER_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return labels
+
+
+def group_by_label(items: List, labels: np.ndarray) -> List[List]:
+    """Items per label in one pass; groups ordered by first appearance, items keep input order."""
+    labels = np.asarray(labels)
+    if len(labels) == 0:
+        return []
+    order = np.argsort(labels, kind="stable")
+    _, starts = np.unique(labels[order], return_index=True)
+    groups = np.split(order, starts[1:])
+    groups.sort(key=lambda g: g[0])
+    return [[items[i] for i in group] for group in groups]
+
+
+def stats() -> Dict[str, int]:
+    return {**counters, "cached": len(_cache)}
@@ -1,12 +1,15 @@
 import asyncio
 import heapq
 from functools import partial
+from itertools import count
 from re import A
 from typing import Callable, Awaitable
 from typing_extensions import override
 
 
 class State(dict):
+    __slots__ = ()  # attributes read and write the dict itself, no __dict__ mirror
+
     def __init__(self, **state):
         super().__init__(state)
 
@@ -18,33 +21,49 @@ class State(dict):
         }
         return State(**inner_substate)
 
-    def __setitem__(self, key, value):
-        super().__setitem__(key, value)
-        self.__dict__.update({key: value})
-
-    def __delitem__(self, key):
-        super().__delitem__(key)
-        del self.__dict__[key]
-
     def __getattr__(self, attr):
         return self.get(attr)
 
     def __setattr__(self, key, value):
-        self.__setitem__(key, value)
+        self[key] = value
 
     def __delattr__(self, item):
-        self.__delitem__(item)
+        del self[item]
 
     def __eq__(self, state):
         return state.items() == self.items()
 
 
+class FrozenState(State):
+    """Immutable State with a cached hash, used as a search node key by AStarPlanner."""
+    __slots__ = ("_hash",)
+
+    def __init__(self, state: dict):
+        dict.__init__(self, state)
+        object.__setattr__(self, "_hash", hash(frozenset(state.items())))
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, state):
+        return self is state or dict.__eq__(self, state)
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("FrozenState is immutable; use substate() for a mutable copy")
+
+    __setitem__ = __delitem__ = __setattr__ = __delattr__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+
 class Action:
     def __init__(self, name: str):
 
         self.name = name
         self.preconditions = []
         self.effects = []
+        # state key read by each precondition / written by each effect, in registration order
+        self.precondition_keys = []
+        self.effect_keys = []
 
     def precondition(self, key):
         def decorator(condition):
@@ -55,6 +74,7 @@ class Action:
                 return result
 
             self.preconditions.append(checked_condition)
+            self.precondition_keys.append(key)
             return checked_condition
 
         return decorator
@@ -67,6 +87,7 @@ class Action:
                     state[key] = result
 
             self.effects.append(effect)
+            self.effect_keys.append(key)
             return effect
 
         return decorator
@@ -115,6 +136,67 @@ class Goal:
         return state == self._final_state
 
 
+class ApplicabilityIndex:
+    """
+    Key -> preconditions dependency index over an action library. Precondition
+    results are carried from a search node to its successors, and only the
+    preconditions reading a key the action changed are evaluated again.
+    Preconditions or effects added without a key (bypassing precondition() /
+    affects()) are treated as reading / writing every key.
+    """
+
+    def __init__(self, actions: list[Action]):
+        self.actions = actions
+        self.checks = []  # every precondition of every action, in action order
+        self.owner = []  # action id of each check
+        self.spans = []  # check id range of each action
+        self.readers: dict[str, list[int]] = {}
+        self.volatile = []  # checks with an unknown key, run for every successor
+        self.writes = []  # keys written by each action, None if unknown
+        for action_id, action in enumerate(actions):
+            start = len(self.checks)
+            keyed = len(action.precondition_keys) == len(action.preconditions)
+            for i, condition in enumerate(action.preconditions):
+                check_id = len(self.checks)
+                self.checks.append(condition)
+                self.owner.append(action_id)
+                if keyed:
+                    self.readers.setdefault(action.precondition_keys[i], []).append(check_id)
+                else:
+                    self.volatile.append(check_id)
+            self.spans.append((start, len(self.checks)))
+            self.writes.append(tuple(action.effect_keys) if len(action.effect_keys) == len(action.effects) else None)
+
+    def evaluate(self, state: State) -> tuple[bytearray, tuple[int, ...]]:
+        """Result of every precondition on `state`, and the ids of the actions that can run."""
+        results = bytearray(bool(check(state)) for check in self.checks)
+        return results, self._applicable(results, range(len(self.actions)))
+
+    def update(self, parent: tuple[bytearray, tuple[int, ...]], state: State, changed: list[str]):
+        """`evaluate` for a successor of the node `parent` was computed for, given the keys that changed."""
+        results, applicable = parent
+        stale = [check_id for key in changed for check_id in self.readers.get(key, ())] + self.volatile
+        flipped = set()
+        for check_id in stale:
+            result = bool(self.checks[check_id](state))
+            if result != results[check_id]:
+                if not flipped:
+                    results = bytearray(results)  # copy on first change
+                results[check_id] = result
+                flipped.add(self.owner[check_id])
+        if not flipped:
+            return results, applicable
+        unchanged = [action_id for action_id in applicable if action_id not in flipped]
+        return results, tuple(sorted(unchanged + list(self._applicable(results, flipped))))
+
+    def _applicable(self, results: bytearray, action_ids) -> tuple[int, ...]:
+        return tuple(i for i in action_ids if all(results[self.spans[i][0]:self.spans[i][1]]))
+
+    def changed(self, action_id: int, before: State, after: State) -> list[str]:
+        keys = self.writes[action_id]
+        return [key for key in (before if keys is None else keys) if after[key] != before[key]]
+
+
 class Planner:
     def __init__(self, name: str):
         self.name = name
@@ -150,47 +232,56 @@ class AStarPlanner(Planner):
         if target_goal is None:
             return []
 
-        # Each entry in the open set is a tuple (f, g, state, plan)
-        # f = total estimated cost, g = cost so far, state = current state, plan = actions taken.
-        open_set = []
-        closed_set = set()
-
-        # Start node
-        start_state = current_state.substate()
-        start_h = target_goal.goal_distance(start_state)
-        start_node = (start_h, 0, start_state, [])
-        heapq.heappush(open_set, start_node)
+        # States are interned FrozenStates: built and hashed once, then compared by identity.
+        # Effects only reassign existing keys, so every state in this search has the start
+        # state's key order and its tuple of values identifies it.
+        interned: dict[tuple, FrozenState] = {}
+
+        def intern(state) -> FrozenState:
+            values = tuple(state.values())
+            frozen = interned.get(values)
+            if frozen is None:
+                frozen = interned[values] = FrozenState(state)
+            return frozen
+
+        # Heap entries are (f, g, tie, state); the counter breaks ties so states are never compared.
+        # Plans are rebuilt from parent pointers instead of being copied on every push.
+        start_state = intern(current_state)
+        # Precondition results per state; successors only re-check keys their action changed
+        index = ApplicabilityIndex(actions)
+        applicability = {start_state: index.evaluate(start_state)}
+        best_g = {start_state: 0}
+        parents: dict[FrozenState, tuple[FrozenState, Action]] = {}
+        tie = count()
+        open_set = [(target_goal.goal_distance(start_state), 0, next(tie), start_state)]
 
         while open_set:
-            f, g, state, plan = heapq.heappop(open_set)
-
-            # Use a tuple of sorted items as a hashable state representation.
-            state_key = tuple(sorted(state.items()))
-            if state_key in closed_set:
-                continue
-            closed_set.add(state_key)
+            f, g, _, state = heapq.heappop(open_set)
+            if g > best_g[state]:
+                continue  # a cheaper path to this state was found after this entry was pushed
 
-            # Check if the goal is met
             if target_goal.evaluate(state):
-                return plan
-
-            # Expand all applicable actions
-            for action in actions:
-                if action.will_run_given(state):
-                    # Simulate the action on a deep copy to avoid side effects.
-                    new_state = action.test(
-                        state
-                    )  # action.__call__ applies its effects
-                    new_plan = plan + [action]
-                    new_g = g + 1  # Assuming uniform cost of 1 per action
-                    new_h = target_goal.goal_distance(new_state)
-                    new_f = new_g + new_h
-
-                    new_state_key = tuple(sorted(new_state.items()))
-                    if new_state_key in closed_set:
-                        continue
-
-                    heapq.heappush(open_set, (new_f, new_g, new_state, new_plan))
+                plan = []
+                while state in parents:
+                    state, action = parents[state]
+                    plan.append(action)
+                return plan[::-1]
+
+            new_g = g + 1  # Assuming uniform cost of 1 per action
+            checked = applicability[state]
+            for action_id in checked[1]:
+                action = actions[action_id]
+                mutation = State(**state)
+                for effect in action.effects:
+                    effect(mutation)
+                new_state = intern(mutation)
+                if new_g >= best_g.get(new_state, new_g + 1):
+                    continue  # dominated: already reached at least as cheaply
+                if new_state not in applicability:
+                    applicability[new_state] = index.update(checked, new_state, index.changed(action_id, state, new_state))
+                best_g[new_state] = new_g
+                parents[new_state] = (state, action)
+                heapq.heappush(open_set, (new_g + target_goal.goal_distance(new_state), new_g, next(tie), new_state))
 
         return []
 
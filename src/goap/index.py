@@ -0,0 +1,279 @@
+from __future__ import annotations
+import os
+import shutil
+import json
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import faiss
+import numpy as np
+
+# Corpus sizes at which "auto" switches index type
+FLAT_MAX = 20_000
+HNSW_MAX = 1_000_000
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+IVF_MIN_TRAIN_PER_LIST = 39
+
+
+def normalize(vecs) -> np.ndarray:
+    """float32, 2-d, unit-length rows (cosine similarity becomes inner product)."""
+    vecs = np.array(vecs, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vecs /= norms
+    return vecs
+
+
+def choose_index_kind(n: int) -> str:
+    if n <= FLAT_MAX:
+        return "flat"
+    if n <= HNSW_MAX:
+        return "hnsw"
+    return "ivf"
+
+
+class VectorIndex(ABC):
+    """Inner-product index over normalized vectors; ids are insertion positions."""
+
+    kind = ""
+
+    @abstractmethod
+    def add(self, vecs: np.ndarray):
+        pass
+
+    @abstractmethod
+    def search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (scores, ids) of shape (len(queries), top_k), best first; missing ids are -1."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    @abstractmethod
+    def vectors(self, ids) -> np.ndarray:
+        """Stored (normalized) vectors for `ids`."""
+
+    @abstractmethod
+    def save(self, path: str):
+        pass
+
+
+class NumpyIndex(VectorIndex):
+    """Brute-force matrix in a capacity-doubling float32 buffer."""
+
+    kind = "numpy"
+
+    def __init__(self, capacity: int = 1024):
+        self._buf = None
+        self._n = 0
+        self._capacity = capacity
+
+    @property
+    def vecs(self) -> np.ndarray:
+        if self._buf is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._buf[:self._n]
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _reserve(self, n: int, dim: int):
+        if self._buf is None:
+            self._buf = np.empty((max(self._capacity, n), dim), dtype=np.float32)
+        elif self._buf.shape[1] != dim:
+            raise ValueError(f"Expected {self._buf.shape[1]}-d vectors, got {dim}-d")
+        elif self._n + n > len(self._buf):
+            capacity = max(len(self._buf) * 2, self._n + n)
+            grown = np.empty((capacity, dim), dtype=np.float32)
+            grown[:self._n] = self._buf[:self._n]
+            self._buf = grown
+
+    def add(self, vecs: np.ndarray):
+        self._reserve(len(vecs), vecs.shape[1])
+        self._buf[self._n:self._n + len(vecs)] = vecs
+        self._n += len(vecs)
+
+    def search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = queries @ self.vecs.T
+        k = min(top_k, self._n)
+        if k < self._n:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(self._n), scores.shape)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+    def vectors(self, ids) -> np.ndarray:
+        return self.vecs[np.asarray(ids, dtype=np.int64)]
+
+    def save(self, path: str):
+        np.save(path, self.vecs)
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyIndex":
+        index = cls()
+        vecs = np.load(path)
+        if len(vecs):
+            index.add(vecs)
+        return index
+
+
+class FaissIndex(VectorIndex):
+    """FAISS flat / HNSW / IVF index using inner product on normalized vectors."""
+
+    def __init__(self, kind: str, dim: int, index: Optional[faiss.Index] = None):
+        self.kind = kind
+        self.dim = dim
+        self.index = index
+
+    @classmethod
+    def build(cls, kind: str, vecs: np.ndarray) -> "FaissIndex":
+        dim = vecs.shape[1]
+        if kind == "flat":
+            index = faiss.IndexFlatIP(dim)
+        elif kind == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        elif kind == "ivf":
+            nlist = max(1, min(int(4 * np.sqrt(len(vecs))), len(vecs) // IVF_MIN_TRAIN_PER_LIST))
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(vecs)
+            index.nprobe = max(1, nlist // 16)
+        else:
+            raise ValueError(f"Unknown index kind: {kind}")
+        built = cls(kind, dim, index)
+        built.add(vecs)
+        return built
+
+    def __len__(self) -> int:
+        return self.index.ntotal
+
+    def add(self, vecs: np.ndarray):
+        self.index.add(np.ascontiguousarray(vecs, dtype=np.float32))
+
+    def search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.index.search(np.ascontiguousarray(queries, dtype=np.float32), min(top_k, len(self)))
+
+    def vectors(self, ids) -> np.ndarray:
+        if self.kind == "ivf":
+            faiss.extract_index_ivf(self.index).make_direct_map()
+        return self.index.reconstruct_batch(np.asarray(ids, dtype=np.int64))
+
+    def save(self, path: str):
+        faiss.write_index(self.index, path)
+
+    @classmethod
+    def load(cls, kind: str, path: str) -> "FaissIndex":
+        index = faiss.read_index(path)
+        return cls(kind, index.d, index)
+
+
+def build_index(kind: str, vecs: np.ndarray) -> VectorIndex:
+    if kind == "auto":
+        kind = choose_index_kind(len(vecs))
+    if kind == "numpy":
+        index = NumpyIndex()
+        index.add(vecs)
+        return index
+    return FaissIndex.build(kind, vecs)
+
+
+def index_filename(kind: str) -> str:
+    return "index.npy" if kind == "numpy" else "index.faiss"
+
+
+def load_index(kind: str, path: str) -> VectorIndex:
+    if kind == "numpy":
+        return NumpyIndex.load(path)
+    return FaissIndex.load(kind, path)
+
+
+INDEX_DIR = os.environ.get("INDEX_DIR", os.path.join(tempfile.gettempdir(), "gitguru", "indexes"))
+# Saved revisions of each (repo, name) index kept on disk; older ones are pruned
+INDEX_KEEP_REVISIONS = int(os.environ.get("INDEX_KEEP_REVISIONS", "2"))
+
+
+class IndexStore:
+    """
+    Saved memDBs addressed by (repo, commit, name), e.g. ("owner/repo", sha, "paths"),
+    with the most recently used ones kept loaded.
+    """
+
+    def __init__(self, root: str = INDEX_DIR, max_loaded: int = 16):
+        self.root = root
+        self.max_loaded = max_loaded
+        self._loaded: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()  # get/latest/put run in worker threads
+
+    def path(self, repo: str, commit: str, name: str) -> str:
+        return os.path.join(self.root, repo.replace("/", "__"), commit, name)
+
+    def get(self, repo: str, commit: str, name: str):
+        from goap.llm import memDB
+        key = (repo, commit, name)
+        with self._lock:
+            db = self._loaded.get(key)
+            if db is not None:
+                self._loaded.move_to_end(key)
+                return db
+        path = self.path(repo, commit, name)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        db = memDB.load(path)
+        self._remember(key, db)
+        return db
+
+    def saved(self, repo: str, name: str) -> list:
+        """Commits with a saved `name` index of `repo`, most recently saved first."""
+        repo_dir = os.path.dirname(os.path.dirname(self.path(repo, "_", name)))
+        saved = []
+        for commit in os.listdir(repo_dir) if os.path.isdir(repo_dir) else []:
+            meta = os.path.join(repo_dir, commit, name, "meta.json")
+            try:
+                saved.append((os.path.getmtime(meta), commit))
+            except FileNotFoundError:
+                continue  # not saved, or still being written
+        return [commit for _, commit in sorted(saved, reverse=True)]
+
+    def latest(self, repo: str, name: str):
+        """The most recently saved `name` index of `repo` at any commit, as (commit, memDB), or None."""
+        saved = self.saved(repo, name)
+        if not saved:
+            return None
+        return saved[0], self.get(repo, saved[0], name)
+
+    def put(self, repo: str, commit: str, name: str, db):
+        db.save(self.path(repo, commit, name))
+        self._remember((repo, commit, name), db)
+
+    def prune(self, repo: str, name: str, keep: int = INDEX_KEEP_REVISIONS):
+        """Delete all but the `keep` most recently saved `name` indexes of `repo`."""
+        for commit in self.saved(repo, name)[keep:]:
+            with self._lock:
+                self._loaded.pop((repo, commit, name), None)
+            path = self.path(repo, commit, name)
+            shutil.rmtree(path, ignore_errors=True)
+            try:
+                os.rmdir(os.path.dirname(path))  # the commit directory, unless other indexes live there
+            except OSError:
+                pass
+
+    def _remember(self, key, db):
+        with self._lock:
+            self._loaded[key] = db
+            self._loaded.move_to_end(key)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+
+
+def write_json(path: str, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
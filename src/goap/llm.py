@@ -2,69 +2,357 @@ from openai import AsyncOpenAI
 from typing import Callable, List, AsyncGenerator, Awaitable
 import asyncio
 from abc import ABC, abstractmethod
-import rank_bm25
 import numpy as np
 from numba import jit
 import re
 # import tiktoken
-import hdbscan
-import pandas as pd
+import os
+import json
+from goap.batching import EmbeddingDispatcher, check_texts
+from goap.bm25 import TermStream, bm25l_score
+from goap.cluster import cluster_labels, group_by_label
+from goap.cache import CompletionCache, EmbeddingCache
+from goap.index import VectorIndex, NumpyIndex, normalize, build_index, load_index, index_filename, write_json
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Hashable
+
+# Lower value = served first
+LLM_PRIORITY_INTERACTIVE = 0
+LLM_PRIORITY_BATCH = 1
+LLM_PRIORITY_NAMES = {LLM_PRIORITY_INTERACTIVE: "interactive", LLM_PRIORITY_BATCH: "batch"}
+LLM_MAX_INFLIGHT = int(os.environ.get("LLM_MAX_INFLIGHT", "4"))
+
+# Set per HTTP request; calls made while handling it inherit them
+llm_priority: ContextVar[int] = ContextVar("llm_priority", default=LLM_PRIORITY_BATCH)
+llm_owner: ContextVar[Hashable] = ContextVar("llm_owner", default=None)
+
+
+class LLMScheduler:
+    """
+    Global cap on in-flight completions. Waiting calls are served by priority,
+    and round-robin between owners (HTTP requests) within a priority so one
+    request's fan-out can't starve the others. Cancelled waiters leave the queue.
+    """
+
+    def __init__(self, max_inflight: int = LLM_MAX_INFLIGHT):
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self._queues: Dict[int, OrderedDict[Hashable, Deque[asyncio.Future]]] = {}
+        self.counters = {"calls": 0, "queued": 0, "cancelled": 0}
+        self._waits: Dict[int, Dict[str, float]] = {}
+
+    def _waiting(self) -> int:
+        return sum(len(w) for owners in self._queues.values() for w in owners.values())
+
+    @asynccontextmanager
+    async def slot(self, priority: int | None = None, owner: Hashable = None):
+        priority = llm_priority.get() if priority is None else priority
+        owner = llm_owner.get() if owner is None else owner
+        self.counters["calls"] += 1
+        start = time.monotonic()
+        if self.inflight < self.max_inflight and not self._queues:
+            self.inflight += 1
+        else:
+            self.counters["queued"] += 1
+            future = asyncio.get_running_loop().create_future()
+            self._queues.setdefault(priority, OrderedDict()).setdefault(owner, deque()).append(future)
+            try:
+                await future
+            except asyncio.CancelledError:
+                self.counters["cancelled"] += 1
+                if future.done() and not future.cancelled():
+                    self._release()  # granted a slot just as we were cancelled
+                else:
+                    self._discard(priority, owner, future)
+                raise
+        self._record(priority, time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _record(self, priority: int, waited: float):
+        waits = self._waits.setdefault(priority, {"calls": 0, "wait_seconds": 0.0, "max_wait": 0.0})
+        waits["calls"] += 1
+        waits["wait_seconds"] += waited
+        waits["max_wait"] = max(waits["max_wait"], waited)
+
+    def _discard(self, priority: int, owner: Hashable, future: asyncio.Future):
+        owners = self._queues.get(priority)
+        if owners is None or owner not in owners:
+            return
+        try:
+            owners[owner].remove(future)
+        except ValueError:
+            pass
+        if not owners[owner]:
+            del owners[owner]
+        if not owners:
+            del self._queues[priority]
+
+    def _next(self) -> asyncio.Future | None:
+        for priority in sorted(self._queues):
+            owners = self._queues[priority]
+            while owners:
+                owner, waiters = next(iter(owners.items()))
+                owners.move_to_end(owner)
+                future = waiters.popleft()
+                if not waiters:
+                    del owners[owner]
+                if not future.done():
+                    if not owners:
+                        del self._queues[priority]
+                    return future
+            del self._queues[priority]
+        return None
+
+    def _release(self):
+        self.inflight -= 1
+        while self.inflight < self.max_inflight:
+            future = self._next()
+            if future is None:
+                break
+            self.inflight += 1
+            future.set_result(None)
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "inflight": self.inflight,
+            "waiting": self._waiting(),
+            "queue_wait": {
+                LLM_PRIORITY_NAMES.get(priority, str(priority)): {
+                    "calls": waits["calls"],
+                    "avg_wait_ms": 1000 * waits["wait_seconds"] / waits["calls"],
+                    "max_wait_ms": 1000 * waits["max_wait"],
+                }
+                for priority, waits in sorted(self._waits.items())
+            },
+        }
+
+
+llm_scheduler = LLMScheduler()
+
+# gen_with_evalinject re-evaluates actions at most every EVAL_INTERVAL seconds
+# and only after EVAL_MIN_TOKENS new stream chunks
+EVAL_INTERVAL = float(os.environ.get("EVAL_INTERVAL_MS", "150")) / 1000
+EVAL_MIN_TOKENS = int(os.environ.get("EVAL_MIN_TOKENS", "8"))
+EVAL_WINDOW = int(os.environ.get("EVAL_WINDOW", "512"))
+
 
 class Embeddings:
-    def __init__(self, base_url, model, **kwargs):
+    def __init__(self, base_url, model, cache: EmbeddingCache | None = None, **kwargs):
         self.client = AsyncOpenAI(base_url=base_url, **kwargs)
         self.model = model
+        self.cache = cache
+        self.dispatcher = EmbeddingDispatcher(self._create)
 
-    async def gen(self, texts: list[str]) :
+    async def _create(self, texts: list[str]):
         response = await self.client.embeddings.create(input=texts, model=self.model)
         return [embedding.embedding for embedding in response.data]
+
+    async def gen(self, texts: list[str]) :
+        check_texts(texts)
+        if self.cache is None:
+            return await self.dispatcher.embed(texts)
+        # only embed texts not seen before (once each), then restore input order
+        keys = [self.cache.key(self.model, text) for text in texts]
+        found = await self.cache.get_many(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            vecs = await self.dispatcher.embed(list(missing.values()))
+            fresh = dict(zip(missing, vecs))
+            found.update(await self.cache.put_many(fresh))
+        return [found[key].astype(np.float32).tolist() for key in keys]
     
 @jit
 def cosine_sim(a: list[float], b: list[float]) -> float:
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
 class memDB:
-    def __init__(self, ):
-        self.vecs = np.array([])
+    """
+    Vector store mapping items to embeddings, searched by cosine similarity
+    (results most similar first). Vectors are normalized at insert time.
+
+    backend: "numpy" (brute force, default), "flat", "hnsw", "ivf" (FAISS), or
+    "auto" to pick a FAISS index from the size of the first batch added.
+    """
+    def __init__(self, capacity: int = 1024, backend: str = "numpy"):
+        self.backend = backend
+        self.index: VectorIndex | None = NumpyIndex(capacity) if backend == "numpy" else None
         self.items = []
 
+    def __len__(self):
+        return len(self.items)
+
     def add(self, item, vec):
-        self.vecs = np.append(self.vecs, [vec], axis=0)
-        self.items.append(item)
+        self.extend([item], [vec])
 
     def extend(self, items, vecs):
-        self.vecs = np.append(self.vecs, vecs, axis=0)
+        if len(items) == 0:
+            return
+        vecs = normalize(vecs)
+        if len(vecs) != len(items):
+            raise ValueError(f"Got {len(items)} items but {len(vecs)} vectors")
+        if self.index is None:
+            self.index = build_index(self.backend, vecs)
+        else:
+            self.index.add(vecs)
         self.items.extend(items)
 
     def search(self, query_embedding, top_k=5):
-        similarities = [cosine_sim(query_embedding, embedding) for embedding in self.vecs]
-        relevant_indices = np.argsort(similarities)[-top_k:]
-        return [self.items[i] for i in relevant_indices]
+        return self.search_batch([query_embedding], top_k)[0]
+
+    def search_batch(self, query_embeddings, top_k=5):
+        """Search several queries at once."""
+        queries = normalize(query_embeddings)
+        if not self.items or top_k <= 0:
+            return [[] for _ in range(len(queries))]
+        _, ids = self.index.search(queries, top_k)
+        return [[self.items[i] for i in row if i != -1] for row in ids]
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        kind = self.index.kind if self.index is not None else self.backend
+        if self.index is not None:
+            self.index.save(os.path.join(path, index_filename(kind)))
+        write_json(os.path.join(path, "items.json"), self.items)
+        write_json(os.path.join(path, "meta.json"), {"kind": kind, "backend": self.backend, "count": len(self.items)})
+
+    @classmethod
+    def load(cls, path: str) -> "memDB":
+        with open(os.path.join(path, "meta.json")) as file:
+            meta = json.load(file)
+        db = cls(backend=meta["backend"])
+        with open(os.path.join(path, "items.json")) as file:
+            db.items = json.load(file)
+        if db.items:
+            db.index = load_index(meta["kind"], os.path.join(path, index_filename(meta["kind"])))
+        return db
 
 
 class EvalInjectAction(ABC):
+    # evaluators see the text added since the last evaluation plus the `window` characters before it (None = all of it)
+    window: int | None = EVAL_WINDOW
+
     def __init__(self, name: str):
         self.name = name
 
     @abstractmethod
     async def evaluator(self, text: str) -> bool:
         pass
+
+    async def evaluate_stream(self, text: str, delta: str, shared: Dict) -> bool:
+        """
+        Evaluate the stream so far; `delta` is the text added since the last call.
+        `shared` is per completion stream and common to all its actions: actions are
+        shared between concurrent streams, so incremental state belongs there, not on self.
+        """
+        # the whole delta plus `window` characters of overlap: evaluations can't keep up
+        # with the stream, so more than `window` characters may arrive between calls
+        return await self.evaluator(text[-(len(delta) + self.window):] if self.window else text)
+
     @abstractmethod
     async def injector(self, text: str) -> str:
         pass
 
 class EvalInjectLLM:
-    def __init__(self, base_url, model, **kwargs):
+    def __init__(self, base_url, model, cache: CompletionCache | None = None, scheduler: LLMScheduler = llm_scheduler, **kwargs):
         self.client = AsyncOpenAI(base_url=base_url, **kwargs)
         self.model = model
-    
-    async def gen(self, messages: List[dict], return_thinking: bool = True):
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=messages
-        )
-        content = response.choices[0].message.content
-        return content
+        self.cache = cache
+        self.scheduler = scheduler
+        self.eval_costs: Dict[str, Dict[str, float]] = {}
+
+    async def _evaluate_action(self, action: EvalInjectAction, text: str, delta: str, shared: Dict) -> bool:
+        cost = self.eval_costs.setdefault(action.name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "chars": 0, "triggers": 0, "errors": 0})
+        start = time.monotonic()
+        try:
+            result = await action.evaluate_stream(text, delta, shared)
+        except Exception:
+            cost["errors"] += 1  # a failing evaluator never triggers
+            result = False
+        elapsed = time.monotonic() - start
+        cost["calls"] += 1
+        cost["seconds"] += elapsed
+        cost["max_seconds"] = max(cost["max_seconds"], elapsed)
+        cost["chars"] += min(len(text), len(delta) + action.window) if action.window else len(text)
+        cost["triggers"] += bool(result)
+        return bool(result)
+
+    async def _evaluate(self, actions: List[EvalInjectAction], text: str, delta: str, shared: Dict) -> EvalInjectAction | None:
+        results = await asyncio.gather(*(self._evaluate_action(action, text, delta, shared) for action in actions))
+        return next((action for action, result in zip(actions, results) if result), None)
+
+    def eval_stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-action evaluation cost in gen_with_evalinject."""
+        return {
+            name: {**cost, "avg_ms": 1000 * cost["seconds"] / cost["calls"] if cost["calls"] else 0.0}
+            for name, cost in self.eval_costs.items()
+        }
+
+    async def _create(self, messages: List[dict], **params):
+        async with self.scheduler.slot():
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                **params
+            )
+        usage = response.usage
+        return response.choices[0].message.content, usage.total_tokens if usage else 0
+
+    async def gen(self, messages: List[dict], return_thinking: bool = True, use_cache: bool = True, **params):
+        """params are passed to the completions API (temperature, max_tokens, ...) and are part of the cache key."""
+        if self.cache is None or not use_cache:
+            content, _ = await self._create(messages, **params)
+            return content
+        key = self.cache.key(self.model, messages, params)
+        return await self.cache.get_or_create(key, lambda: self._create(messages, **params))
+
+    async def _pump(self, queue: asyncio.Queue, request: Dict[str, Any]):
+        """Drain a streamed completion into `queue` under a scheduler slot; None marks the end."""
+        try:
+            async with self.scheduler.slot():
+                stream = await self.client.chat.completions.create(stream=True, **request)
+                try:
+                    async for chunk in stream:
+                        content = chunk.choices[0].delta.content if chunk.choices else None
+                        if content:  # role-only and final chunks carry no text
+                            queue.put_nowait(content)
+                finally:
+                    await stream.close()
+        finally:
+            queue.put_nowait(None)
+
+    async def _stream_chunks(self, **request) -> AsyncGenerator[str, None]:
+        """
+        Text chunks of a streamed completion. The slot is held by a background task
+        that drains the upstream response, not across our `yield`s, so a slow or
+        abandoned consumer can't keep it; closing the generator cancels the request.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        pump = asyncio.ensure_future(self._pump(queue, request))
+        try:
+            while (content := await queue.get()) is not None:
+                yield content
+            pump.result()  # re-raise upstream errors
+        finally:
+            pump.cancel()
+
+    async def stream(self, messages: List[dict], **params) -> AsyncGenerator[str, None]:
+        """Yield the completion as it is generated."""
+        chunks = self._stream_chunks(model=self.model, messages=messages, **params)
+        try:
+            async for content in chunks:
+                yield content
+        finally:
+            await chunks.aclose()
 
     async def gen_with_evalinject(self,messages: list[dict],actions: List[EvalInjectAction],) -> AsyncGenerator[str, None]:
         current_messages = messages.copy()
@@ -73,48 +361,70 @@ class EvalInjectLLM:
         
         while True and len(current_messages)-m < 6:
             action_explanation = "Available Actions: " + ", ".join(action.name for action in actions) + "\n to use them, just speak about the thing its supposed to do or say the name of the action."
-            stream = await self.client.chat.completions.create(
+            accumulated_text = ""
+            action_triggered = None
+            shared = {}  # per-stream evaluator state, see EvalInjectAction.evaluate_stream
+
+            # evaluation runs as a background task so chunks are never held back by it;
+            # a new one starts once the previous finished, enough chunks arrived and
+            # EVAL_INTERVAL passed
+            evaluation: asyncio.Task | None = None
+            evaluated = 0
+            new_chunks = 0
+            last_evaluation = time.monotonic()
+
+            def start_evaluation():
+                nonlocal evaluation, evaluated, new_chunks, last_evaluation
+                delta = accumulated_text[evaluated:]
+                evaluated = len(accumulated_text)
+                new_chunks = 0
+                last_evaluation = time.monotonic()
+                evaluation = asyncio.ensure_future(self._evaluate(actions, accumulated_text, delta, shared))
+
+            # the scheduler slot is held only while the upstream response is drained
+            # (see _stream_chunks); injectors may call the LLM themselves
+            chunks = self._stream_chunks(
                 model=self.model,
                 messages=current_messages + [{
                     "role": "system", 
                     "content": action_explanation
                 }],
-                stream=True
             )
-            
-            accumulated_text = ""
-            triggered = False
-            action_triggered = None
-            n = 0
-            
-            async for chunk in stream:
-                content = chunk.choices[0].delta.content or ""
-                accumulated_text += content
-                yield content  # Stream out the response
-                if (n := n + 1) % 6 != 0:
-                    continue
-                action_results = await asyncio.gather(
-                    *(action.evaluator(accumulated_text) for action in actions),
-                    return_exceptions=True  # Prevent single failure from breaking all
-                )
-                for action, result in zip(actions, action_results):
-                    if isinstance(result, Exception):
-                        continue  # Or handle errors as needed
-                    if result:
-                        action_triggered = action
-                        triggered = True
-                        break
-                    
-                if triggered and action_triggered:
-                    # Handle the action injection
-                    injected_content = await action_triggered.injector(accumulated_text)
-                    current_messages.extend([
-                        {"role": "assistant", "content": accumulated_text},
-                        {"role": "system", "content": injected_content}
-                    ])
-                    break  # Exit chunk loop for action handling
-
-            if triggered:
+            try:
+                try:
+                    async for content in chunks:
+                        accumulated_text += content
+                        yield content  # Stream out the response
+                        new_chunks += 1
+                        if evaluation is not None and evaluation.done():
+                            action_triggered, evaluation = evaluation.result(), None
+                            if action_triggered:
+                                break  # Exit chunk loop for action handling
+                        if (
+                            actions and evaluation is None and new_chunks >= EVAL_MIN_TOKENS
+                            and time.monotonic() - last_evaluation >= EVAL_INTERVAL
+                        ):
+                            start_evaluation()
+                finally:
+                    await chunks.aclose()  # also cancels the upstream request after a trigger
+
+                if not action_triggered and actions:
+                    # the stream ended: finish the running evaluation, then check the unevaluated tail
+                    if evaluation is not None:
+                        action_triggered, evaluation = await evaluation, None
+                    if not action_triggered and evaluated < len(accumulated_text):
+                        start_evaluation()
+                        action_triggered, evaluation = await evaluation, None
+            finally:
+                if evaluation is not None:
+                    evaluation.cancel()
+            if action_triggered:
+                # Handle the action injection
+                injected_content = await action_triggered.injector(accumulated_text)
+                current_messages.extend([
+                    {"role": "assistant", "content": accumulated_text},
+                    {"role": "system", "content": injected_content}
+                ])
                 continue  # Restart main loop with updated messages
                 
             current_messages.append({
@@ -123,8 +433,6 @@ class EvalInjectLLM:
             })
             break
 
-        print("Final message chain:", current_messages)
-
 class BaseActionWrapper(EvalInjectAction):
     """Base class for action wrappers to reduce code duplication"""
     def __init__(self, func: Callable[[str], Awaitable[str]]):
@@ -139,21 +447,30 @@ def BM25Action(name: str, query: str, threshold: float = 0.5):
     """Decorator for BM25-based content evaluation"""
     def decorator(func: Callable[[str], Awaitable[str]]):
         class BM25ActionWrapper(BaseActionWrapper):
+            window = None  # scored incrementally over the whole stream
+
             def __init__(self, func: Callable[[str], Awaitable[str]]):
                 super().__init__(func)
                 self.name = name
                 self.query_tokens = query.split()
                 self.threshold = threshold
 
+            async def evaluate_stream(self, text: str, delta: str, shared: Dict) -> bool:
+                # one tokenized stream for every BM25 action on this completion
+                terms = shared.setdefault("terms", TermStream())
+                terms.sync(text)
+                return self._triggered(terms)
+
             async def evaluator(self, text: str) -> bool:
                 """Evaluate using BM25 ranking"""
-                text_tokens = text.lower().split()
-                
-                if not text_tokens:
+                terms = TermStream()
+                terms.feed(text)
+                return self._triggered(terms)
+
+            def _triggered(self, terms: TermStream) -> bool:
+                if not len(terms):
                     return False
-                
-                bm25 = rank_bm25.BM25L([text_tokens])
-                return max(bm25.get_scores(self.query_tokens)) > self.threshold
+                return bm25l_score(terms, self.query_tokens) > self.threshold
 
         return BM25ActionWrapper(func)
     return decorator
@@ -211,29 +528,10 @@ def SemanticAction(name:str,
 
 
 async def acluster(texts, embedder, min_s=2, max_s=1000):
+    """Embed and cluster texts; returns one string per cluster (every text lands in one)."""
     vecs = await embedder.gen(texts)
-    hdb = hdbscan.HDBSCAN(
-        min_samples=min_s, min_cluster_size=min_s, max_cluster_size=max_s, metric="l2"
-    ).fit(vecs)
-    df = pd.DataFrame(
-        {
-            "text": [text for text in texts],
-            "cluster": hdb.labels_,
-        }
-    )
-    len(df)
-    df = df.query("cluster != -1")
-    cluster_texts = []
-    for c in df.cluster.unique():
-        c_str = "\n".join(
-            [
-                f"{row['text']}\n"
-                for row in df.query(f"cluster == {c}").to_dict(orient="records")
-            ]
-        )
-        cluster_texts.append(c_str)
-
-    return cluster_texts
+    labels = await asyncio.to_thread(cluster_labels, vecs, min_s, max_s)
+    return ["\n".join(f"{text}\n" for text in group) for group in group_by_label(texts, labels)]
 
 def chunk(text: str, chunk_on="\n"):
     chunks = text.split(chunk_on)
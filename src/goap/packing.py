@@ -0,0 +1,61 @@
+from __future__ import annotations
+import os
+import math
+from typing import List
+
+# Rough characters per token for English text and code; good enough to stay inside a context window
+CHARS_PER_TOKEN = float(os.environ.get("CHARS_PER_TOKEN", "3.5"))
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_to_budget(text: str, budget: int, sep: str = "\n") -> List[str]:
+    """Split text on `sep` (hard-splitting overlong pieces) into parts of at most `budget` tokens."""
+    if estimate_tokens(text) <= budget:
+        return [text]
+    max_chars = max(1, int(budget * CHARS_PER_TOKEN))
+    parts, current = [], ""
+    for piece in text.split(sep):
+        for i in range(0, max(len(piece), 1), max_chars):
+            part = piece[i:i + max_chars]
+            candidate = f"{current}{sep}{part}" if current else part
+            if current and estimate_tokens(candidate) > budget:
+                parts.append(current)
+                current = part
+            else:
+                current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+
+def truncate_to_budget(text: str, budget: int) -> str:
+    """Cut `text` to at most `budget` tokens."""
+    if estimate_tokens(text) <= budget:
+        return text
+    return text[:max(0, int(budget * CHARS_PER_TOKEN))]
+
+
+def pack(texts: List[str], budget: int, sep: str = " -- ") -> List[List[str]]:
+    """
+    Bin-pack texts into as few groups as possible whose `sep`-joined size fits
+    `budget` tokens (first-fit decreasing). Texts larger than the budget are split.
+    Groups and the texts within them keep the input order.
+    """
+    items = [part for text in texts for part in split_to_budget(text, budget)]
+    sep_tokens = estimate_tokens(sep)
+    bins: List[List[int]] = []
+    used: List[int] = []
+    for index in sorted(range(len(items)), key=lambda i: len(items[i]), reverse=True):
+        size = estimate_tokens(items[index])
+        for i, total in enumerate(used):
+            if total + sep_tokens + size <= budget:
+                bins[i].append(index)
+                used[i] += sep_tokens + size
+                break
+        else:
+            bins.append([index])
+            used.append(size)
+    return [[items[i] for i in sorted(group)] for group in sorted(bins, key=min)]
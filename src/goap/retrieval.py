@@ -0,0 +1,145 @@
+from __future__ import annotations
+import os
+import re
+import math
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Sequence, Union
+
+import numpy as np
+
+from goap.llm import memDB
+
+# Candidates kept by the lexical stage; only these are embedded
+RETRIEVAL_PREFILTER = int(os.environ.get("RETRIEVAL_PREFILTER", "200"))
+RETRIEVAL_INDEX_CACHE = int(os.environ.get("RETRIEVAL_INDEX_CACHE", "32"))
+RRF_K = 60
+
+_WORD = re.compile(r"[A-Za-z0-9]+")
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased words, with identifiers also split into their parts:
+    "src/FileTree.py" -> ["src", "filetree", "file", "tree", "py"]; snake_case splits on "_".
+    """
+    tokens = []
+    for word in _WORD.findall(text):
+        lower = word.lower()
+        tokens.append(lower)
+        parts = _CAMEL.findall(word)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index; a query only touches the postings of its terms."""
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(texts)
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[doc_id] = len(tokens)
+            for token in tokens:
+                docs = postings.setdefault(token, {})
+                docs[doc_id] = docs.get(doc_id, 0) + 1
+        avgdl = float(lengths.mean()) if self.size and lengths.mean() > 0 else 1.0
+        self._norm = k1 * (1 - b + b * lengths / avgdl)
+        self.postings = {
+            term: (np.fromiter(docs.keys(), dtype=np.int64, count=len(docs)),
+                   np.fromiter(docs.values(), dtype=np.float32, count=len(docs)))
+            for term, docs in postings.items()
+        }
+
+    def idf(self, term: str) -> float:
+        n = len(self.postings[term][0])
+        return math.log((self.size - n + 0.5) / (n + 0.5) + 1)
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            ids, tf = self.postings[term]
+            scores[ids] += self.idf(term) * tf * (self.k1 + 1) / (tf + self._norm[ids])
+        return scores
+
+    def top(self, query: str, k: int) -> List[int]:
+        """Ids of the best k documents with a positive score, best first."""
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        return matched[np.argsort(-scores[matched], kind="stable")].tolist()
+
+
+# finished indexes, or the future of one being built
+_indexes: OrderedDict[Hashable, Union[BM25Index, asyncio.Future]] = OrderedDict()
+
+
+async def bm25_index(texts: Sequence[str], key: Optional[Hashable] = None) -> BM25Index:
+    """
+    BM25 index for `texts`, built in a worker thread. With a `key` (e.g. a tree
+    SHA) that identifies the corpus, the index is cached and concurrent builds
+    are shared; the texts themselves are never hashed.
+    """
+    if key is None:
+        return await asyncio.to_thread(BM25Index, texts)
+    entry = _indexes.get(key)
+    if isinstance(entry, BM25Index):
+        _indexes.move_to_end(key)
+        return entry
+    if entry is None:
+        entry = _indexes[key] = asyncio.ensure_future(asyncio.to_thread(BM25Index, texts))
+        while len(_indexes) > RETRIEVAL_INDEX_CACHE:
+            _indexes.popitem(last=False)
+    try:
+        index = await asyncio.shield(entry)
+    except Exception:
+        if _indexes.get(key) is entry:
+            del _indexes[key]
+        raise
+    if _indexes.get(key) is entry:
+        _indexes[key] = index
+    return index
+
+
+def rrf(*rankings: List[int], k: int = RRF_K) -> List[int]:
+    """Reciprocal-rank fusion of several best-first id lists."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])
+
+
+async def hybrid_search(texts: List[str], query: str, embeddings, k: int = 10, prefilter: int = RETRIEVAL_PREFILTER,
+                        key: Optional[Hashable] = None) -> List[str]:
+    """
+    Top `k` texts for `query`. BM25 picks up to `prefilter` candidates (all texts
+    if there are fewer), only those are embedded, and the lexical and vector
+    rankings are combined with reciprocal-rank fusion. `key` caches the BM25
+    index for a corpus that is searched repeatedly (see bm25_index).
+    """
+    if not texts:
+        return []
+    index = await bm25_index(texts, key)
+    lexical = index.top(query, prefilter)
+    if len(texts) <= prefilter:
+        candidates = list(range(len(texts)))
+    else:
+        # pad with unmatched texts so the vector stage still has something to rank
+        seen = set(lexical)
+        candidates = lexical + [i for i in range(len(texts)) if i not in seen][:max(0, prefilter - len(lexical))]
+
+    vecs = await embeddings.gen([texts[i] for i in candidates] + [query])
+    db = memDB()
+    db.extend(candidates, vecs[:-1])
+    semantic = db.search(vecs[-1], len(candidates))
+    return [texts[i] for i in rrf(lexical, semantic)[:k]]
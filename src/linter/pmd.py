@@ -1,18 +1,7 @@
 import os
-import tempfile
-import subprocess
 import docker
 
-def clone_repo_to_temp(repo_url):
-    temp_dir = tempfile.mkdtemp()
-    print(f"Cloning repository into temporary directory: {temp_dir}")
-    try:
-        subprocess.run(['git', 'clone', repo_url, temp_dir], check=True)
-        print(f"Repository cloned successfully.")
-    except subprocess.CalledProcessError as e:
-        os.rmdir(temp_dir)
-        raise RuntimeError(f"Failed to clone repository: {e}")
-    return temp_dir
+from app.mirrors import mirror_cache
 
 def generate_pmd_ruleset(ruleset_path):
     ruleset_content = """<?xml version="1.0"?>
@@ -81,15 +70,13 @@ def lint_repo_with_pmd_docker(repo_path, ruleset_path, output_format='text', out
         print(f"Docker API error: {e}")
         raise
 
-def main(repo_url, output_format='text', output_file=None):
-    temp_dir = clone_repo_to_temp(repo_url)
-    try:
-        ruleset_path = os.path.join(temp_dir, "custom_ruleset.xml")
+def main(repo_url, output_format='text', output_file=None, rev='HEAD'):
+    # worktree from the shared mirror cache instead of a fresh clone per run
+    with mirror_cache.checkout(repo_url, rev) as worktree:
+        print(f"Linting {repo_url}@{rev} in worktree: {worktree}")
+        ruleset_path = os.path.join(worktree, "custom_ruleset.xml")
         generate_pmd_ruleset(ruleset_path)
-        lint_repo_with_pmd_docker(temp_dir, ruleset_path, output_format, output_file)
-    finally:
-        print(f"Cleaning up temporary directory: {temp_dir}")
-        subprocess.run(['rm', '-rf', temp_dir], check=True)
+        lint_repo_with_pmd_docker(worktree, ruleset_path, output_format, output_file)
 
 if __name__ == "__main__":
     repo_url = "https://github.com/ankitprasad2005/chess_err_hexa"
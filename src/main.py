@@ -1,11 +1,21 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
+from app.middleware import LLMRequestMiddleware
 from app.routes import router
+from app.sessions import pool
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await pool.start()
+    yield
+    await pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "https://github.com",
@@ -21,6 +31,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(LLMRequestMiddleware)
+
 app.include_router(router)
 
 
@@ -5,6 +5,8 @@ from urllib.parse import urljoin
 import json
 import argparse
 
+from app.sessions import pool
+
 async def SearxngSearch(
     query: str,
     language: str = 'en-US',
@@ -25,30 +27,30 @@ async def SearxngSearch(
         'safesearch': 0
     }
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(
-                search_endpoint,
-                params=params,
-                headers={'Accept': 'application/json'}
-            ) as response:
-                response.raise_for_status()
-                data = await response.json()
-                
-                return [{
-                    'title': result.get('title', ''),
-                    'snippet': result.get('content', ''),
-                    'url': result.get('url', '')
-                } for result in data.get('results', [])]
-
-        except aiohttp.ClientError as e:
-            print(f"Network error: {str(e)}")
-        except json.JSONDecodeError:
-            print("Invalid JSON response")
-        except KeyError:
-            print("Unexpected response format")
+    session = await pool.session()
+    try:
+        async with session.get(
+            search_endpoint,
+            params=params,
+            headers={'Accept': 'application/json'}
+        ) as response:
+            response.raise_for_status()
+            data = await response.json()
             
-        return []
+            return [{
+                'title': result.get('title', ''),
+                'snippet': result.get('content', ''),
+                'url': result.get('url', '')
+            } for result in data.get('results', [])]
+
+    except aiohttp.ClientError as e:
+        print(f"Network error: {str(e)}")
+    except json.JSONDecodeError:
+        print("Invalid JSON response")
+    except KeyError:
+        print("Unexpected response format")
+        
+    return []
 
 async def main():
     parser = argparse.ArgumentParser(description='Async SearxNG Search')
@@ -70,5 +72,7 @@ async def main():
         print(f"Snippet: {result['snippet'][:150]}...\n")
         print("-" * 80)
 
+    await pool.close()
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
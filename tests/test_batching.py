@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from goap.batching import EmbeddingDispatcher
+from goap.packing import estimate_tokens
+
+
+class Recorder:
+    def __init__(self):
+        self.batches = []
+
+    async def __call__(self, texts):
+        self.batches.append(list(texts))
+        return [len(text) for text in texts]
+
+
+def test_batches_are_capped_by_count_and_tokens():
+    recorder = Recorder()
+    dispatcher = EmbeddingDispatcher(recorder, batch_size=8, max_wait=0.001, max_tokens=100)
+    texts = [f"{i}" + "x" * 100 for i in range(6)] + ["y" * 2000] + [f"short {i}" for i in range(20)]
+
+    async def main():
+        return await dispatcher.embed(texts + texts[:3])
+
+    vecs = asyncio.run(main())
+    assert vecs == [len(text) for text in texts + texts[:3]]
+    for batch in recorder.batches:
+        assert len(batch) <= 8
+        # a text over the budget travels alone; everything else fits it
+        assert len(batch) == 1 or sum(estimate_tokens(text) for text in batch) <= 100
+    assert sorted(text for batch in recorder.batches for text in batch) == sorted(texts)
+
+
+def test_non_string_inputs_are_rejected():
+    dispatcher = EmbeddingDispatcher(Recorder())
+    with pytest.raises(TypeError, match="must be strings"):
+        asyncio.run(dispatcher.embed(["ok", ["nested", "list"]]))
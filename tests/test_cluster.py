@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from goap.cluster import cluster_labels, group_by_label
+
+
+def blobs(n, centers=3, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    means = rng.standard_normal((centers, dim)) * 10
+    return (means[rng.integers(0, centers, n)] + rng.standard_normal((n, dim))).astype(np.float32)
+
+
+def test_labels_are_shared_read_only():
+    vecs = blobs(300)
+    labels = cluster_labels(vecs, 5, 1000)
+    assert cluster_labels(vecs, 5, 1000) is labels
+    assert (labels >= 0).all()
+    with pytest.raises(ValueError):
+        labels[0] = 7
+
+
+def test_clusters_never_exceed_max_size():
+    vecs = blobs(600, centers=2, seed=1)
+    labels = cluster_labels(vecs, 5, 100)
+    assert np.bincount(labels).max() <= 100
+    groups = group_by_label(list(range(len(vecs))), labels)
+    assert sorted(i for group in groups for i in group) == list(range(len(vecs)))
@@ -0,0 +1,13 @@
+from goap.cache import CompletionCache
+
+
+def messages(content):
+    return [{"role": "user", "content": content}]
+
+
+def test_key_ignores_only_outer_whitespace():
+    key = CompletionCache.key
+    assert key("m", messages("fix this\n"), {}) == key("m", messages("  fix this"), {})
+    # code that differs only in indentation or line breaks is a different prompt
+    assert key("m", messages("if x:\n    y()"), {}) != key("m", messages("if x:\n        y()"), {})
+    assert key("m", messages("a = 1\nb = 2"), {}) != key("m", messages("a = 1 b = 2"), {})
@@ -0,0 +1,83 @@
+import asyncio
+
+from app import dataloaders
+from app.filetree import FileTree
+from app.issuematch import IdentifierIndex, IssueMatcher, extract_references
+
+SOURCES = {
+    "src/app/filetree.py": "class FileTree:\n    def with_extension(self, *exts):\n        pass\n",
+    "src/app/dataloaders.py": "async def find_issue_context(owner, repo, number):\n    pass\n",
+    "src/goap/index.py": "def build_index(vecs):\n    pass\n",
+    "src/goap/__init__.py": "",
+    "web/utils/helpers.js": "export const formatDate = (d) => d.toISOString()\n",
+    "docs/usage.md": "# Usage\n",
+    "tests/test_tasks.py": "def test_run():\n    pass\n",
+}
+
+ISSUE = [
+    """FileTree.with_extension crashes on compound suffixes
+
+```
+Traceback (most recent call last):
+  File "/home/me/project/src/app/dataloaders.py", line 400, in find_issue_context
+  File "/usr/lib/python3.13/asyncio/tasks.py", line 12, in run
+KeyError: '.gz'
+```""",
+    "@someone: also seen via `from goap import index`, see docs/usage.md",
+]
+
+
+def make_tree(revision="rev1"):
+    tree = FileTree({"path": path, "type": "blob", "size": len(text)} for path, text in SOURCES.items())
+    tree.revision = revision
+    return tree
+
+
+def test_extract_references():
+    refs = extract_references(ISSUE)
+    assert refs.paths["home/me/project/src/app/dataloaders.py"] > 0
+    assert "docs/usage.md" in refs.paths
+    assert "goap" in refs.modules
+    assert refs.identifiers["find_issue_context"] > refs.identifiers["filetree"]
+    assert "index" in refs.identifiers
+
+
+def test_index_ranks_files_the_issue_points_at():
+    index = IdentifierIndex(make_tree(), read=SOURCES.__getitem__)
+    related = index.match(extract_references(ISSUE), k=4)
+    assert related[0] == "src/app/dataloaders.py"
+    assert set(related[:4]) == {"src/app/dataloaders.py", "src/app/filetree.py", "src/goap/index.py", "docs/usage.md"}
+    assert "web/utils/helpers.js" not in related
+
+
+def test_paths_only_without_local_blobs():
+    index = IdentifierIndex(make_tree())
+    assert index.symbols == {}
+    related = index.match(extract_references(["broken in `helpers.js` formatting"]))
+    assert related == ["web/utils/helpers.js"]
+
+
+def test_find_issue_context_response_shape(monkeypatch):
+    class FakeRepositoryManager:
+        async def get_filetree(self, owner, repo):
+            return make_tree()
+
+        async def local_reader(self, owner, repo, tree):
+            return SOURCES.__getitem__
+
+    class FakeIssueManager:
+        async def iter_issue_thread(self, owner, repo, number):
+            for message in ISSUE:
+                yield message
+
+    monkeypatch.setattr(dataloaders, "repository_manager", FakeRepositoryManager)
+    monkeypatch.setattr(dataloaders, "IssueManager", FakeIssueManager)
+    monkeypatch.setattr(dataloaders, "issue_matcher", IssueMatcher())
+
+    data = asyncio.run(dataloaders.find_issue_context("o", "r", 1))
+    assert set(data) == {"conversation", "code_blocks", "tree", "related_files"}
+    assert data["conversation"] == ISSUE
+    assert len(data["code_blocks"]) == 1
+    assert isinstance(data["tree"], FileTree) and len(data["tree"]) == len(SOURCES)
+    assert data["related_files"][0] == "src/app/dataloaders.py"
+    assert len(data["related_files"]) < len(SOURCES)
@@ -0,0 +1,100 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from goap.llm import BM25Action, EvalInjectLLM, LLMScheduler
+
+
+class FakeStream:
+    def __init__(self, texts, fail=False):
+        self.texts = texts
+        self.fail = fail
+        self.closed = False
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None))])  # role-only chunk
+        for text in self.texts:
+            await asyncio.sleep(0)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+        if self.fail:
+            raise RuntimeError("upstream failed")
+
+    async def close(self):
+        self.closed = True
+
+
+def make_llm(stream):
+    llm = EvalInjectLLM("http://localhost:1", "fake-model", scheduler=LLMScheduler(max_inflight=1), api_key="test")
+
+    async def create(**request):
+        assert request["stream"] is True
+        return stream
+
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return llm
+
+
+def test_slot_is_not_held_by_a_slow_consumer():
+    stream = FakeStream(["a", "b", "c"])
+    llm = make_llm(stream)
+
+    async def main():
+        chunks = llm.stream([{"role": "user", "content": "hi"}])
+        first = await anext(chunks)
+        for _ in range(10):  # the consumer stalls; the upstream response is drained meanwhile
+            await asyncio.sleep(0)
+        inflight = llm.scheduler.inflight
+        rest = [chunk async for chunk in chunks]
+        return first, rest, inflight
+
+    first, rest, inflight = asyncio.run(main())
+    assert [first] + rest == ["a", "b", "c"]
+    assert inflight == 0
+    assert stream.closed
+
+
+def test_closing_the_consumer_releases_the_slot():
+    stream = FakeStream(["x"] * 1000)
+    llm = make_llm(stream)
+
+    async def main():
+        chunks = llm.gen_with_evalinject([{"role": "user", "content": "hi"}], [])
+        await anext(chunks)
+        await chunks.aclose()  # the SSE client went away
+        await asyncio.sleep(0)
+        return llm.scheduler.inflight
+
+    assert asyncio.run(main()) == 0
+    assert stream.closed
+
+
+def test_upstream_errors_reach_the_consumer_and_close_the_stream():
+    stream = FakeStream(["a"], fail=True)
+    llm = make_llm(stream)
+
+    async def main():
+        return [chunk async for chunk in llm.stream([{"role": "user", "content": "hi"}])]
+
+    with pytest.raises(RuntimeError, match="upstream failed"):
+        asyncio.run(main())
+    assert stream.closed
+    assert llm.scheduler.inflight == 0
+
+
+def test_bm25_action_state_is_per_stream():
+    @BM25Action("stop", "stop", threshold=0.5)
+    async def stop(text):
+        return "stopped"
+
+    async def main():
+        first, second = {}, {}
+        assert not await stop.evaluate_stream("stop", "stop", first)
+        assert not await stop.evaluate_stream("hello", "hello", second)  # a concurrent stream
+        text = "stop stop stop now"
+        return await stop.evaluate_stream(text, text[4:], first), await stop.evaluate_stream("hello there", " there", second)
+
+    assert asyncio.run(main()) == (True, False)
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from app.middleware import LLMRequestMiddleware
+
+SCOPE = {"type": "http", "path": "/chat"}
+
+
+async def slow_app(scope, receive, send):
+    await asyncio.sleep(3600)
+
+
+def test_client_disconnect_ends_the_request_quietly():
+    async def main():
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        task = asyncio.ensure_future(LLMRequestMiddleware(slow_app)(SCOPE, receive, None))
+        await asyncio.sleep(0)
+        disconnect.set()
+        await asyncio.wait_for(task, timeout=5)
+        return task
+
+    assert not asyncio.run(main()).cancelled()
+
+
+def test_server_cancellation_propagates():
+    async def main():
+        async def receive():
+            await asyncio.sleep(3600)
+
+        task = asyncio.ensure_future(LLMRequestMiddleware(slow_app)(SCOPE, receive, None))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return task
+
+    assert asyncio.run(main()).cancelled()
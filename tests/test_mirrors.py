@@ -0,0 +1,66 @@
+import os
+import subprocess
+import threading
+
+import pytest
+
+from app.mirrors import MirrorCache
+
+
+def git(*args, cwd=None):
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd, check=True, capture_output=True,
+    )
+
+
+@pytest.fixture
+def origin(tmp_path):
+    """A local bare repository with one commit holding README.md and src/app.py."""
+    work = tmp_path / "work"
+    os.makedirs(work / "src")
+    (work / "README.md").write_text("hello\n")
+    (work / "src" / "app.py").write_text("print('app')\n")
+    git("init", "--quiet", str(work))
+    git("add", "-A", cwd=work)
+    git("commit", "--quiet", "-m", "initial", cwd=work)
+    bare = tmp_path / "origin.git"
+    git("clone", "--quiet", "--bare", str(work), str(bare))
+    return str(bare)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return MirrorCache(root=str(tmp_path / "mirrors"), fetch_interval=3600)
+
+
+def test_checkout_worktree_and_sparse_export(cache, origin):
+    with cache.checkout(origin) as worktree:
+        assert open(os.path.join(worktree, "README.md")).read() == "hello\n"
+        assert os.path.exists(os.path.join(worktree, "src", "app.py"))
+    assert not os.path.exists(worktree)
+
+    with cache.checkout(origin, paths=["src"]) as export:
+        assert os.listdir(export) == ["src"]
+
+
+def test_fresh_mirror_is_shared_with_an_open_checkout(cache, origin):
+    with cache.checkout(origin):
+        # a second job on the same repo must not wait for the first checkout to finish
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(path=cache.mirror(origin)))
+        thread.start()
+        thread.join(timeout=10)
+        assert not thread.is_alive(), "mirror() blocked behind an open checkout"
+        with cache.checkout(origin) as second:
+            assert os.path.exists(os.path.join(second, "README.md"))
+    assert result["path"] == cache.mirror(origin)
+
+
+@pytest.mark.parametrize("rev", ["--upload-pack=touch pwned", "-h", ""])
+def test_option_like_revisions_are_rejected(cache, origin, rev):
+    with pytest.raises(ValueError):
+        cache.mirror(origin, rev)
+    with pytest.raises(ValueError):
+        with cache.checkout(origin, rev):
+            pass
@@ -0,0 +1,19 @@
+from goap.packing import estimate_tokens, pack, truncate_to_budget
+
+
+def test_pack_keeps_input_order():
+    texts = [f"{i}:" + "x" * (7 * (i % 4 + 1)) for i in range(12)]
+    groups = pack(texts, budget=20)
+    for group in groups:
+        assert group == sorted(group, key=texts.index)
+        assert estimate_tokens(" -- ".join(group)) <= 20
+    assert [texts.index(group[0]) for group in groups] == sorted(texts.index(group[0]) for group in groups)
+    assert sorted(text for group in groups for text in group) == sorted(texts)
+
+
+def test_truncate_to_budget():
+    assert truncate_to_budget("short", 10) == "short"
+    text = "y" * 1000
+    cut = truncate_to_budget(text, 10)
+    assert text.startswith(cut)
+    assert 0 < estimate_tokens(cut) <= 10
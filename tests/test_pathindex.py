@@ -0,0 +1,79 @@
+import asyncio
+import hashlib
+import os
+
+import numpy as np
+
+from app.filetree import FileTree
+from app.pathindex import PathIndex
+from goap.index import IndexStore
+
+
+class CountingEmbeddings:
+    """Deterministic pseudo-random vectors per text; counts what gets embedded."""
+    model = "fake/embedder"
+
+    def __init__(self):
+        self.embedded = 0
+
+    async def gen(self, texts):
+        self.embedded += len(texts)
+        return np.stack([
+            np.random.default_rng(int.from_bytes(hashlib.sha256(t.encode()).digest()[:8], "little")).standard_normal(16)
+            for t in texts
+        ]).astype(np.float32)
+
+
+def tree(paths, revision):
+    files = FileTree({"path": p, "type": "blob"} for p in paths)
+    files.revision = revision
+    return files
+
+
+def test_incremental_builds_and_saved_index(tmp_path):
+    paths = [f"pkg{i % 20}/module_{i}.py" for i in range(3000)] + ["src/app/routes.py"]
+    embeddings = CountingEmbeddings()
+    index = PathIndex(embeddings, store=IndexStore(root=str(tmp_path)), backend="numpy")
+
+    async def main():
+        first = await index.search("o", "r", tree(paths, "rev1"), "routes", k=3)
+        embeddings.embedded = 0
+        again = await index.search("o", "r", tree(paths, "rev1"), "routes", k=3)
+        repeat_cost = embeddings.embedded
+
+        # next revision: 100 paths removed, one added
+        embeddings.embedded = 0
+        changed = paths[100:] + ["src/app/pathindex.py"]
+        await index.search("o", "r", tree(changed, "rev2"), "pathindex", k=3)
+        return first, again, repeat_cost, embeddings.embedded
+
+    first, again, repeat_cost, update_cost = asyncio.run(main())
+    assert first[0] == again[0] == "src/app/routes.py"
+    assert repeat_cost == 1  # only the query
+    assert update_cost == 2  # the added path and the query
+    stats = index.stats()
+    assert stats["hits"] == 1
+    assert stats["incremental_builds"] == 1
+    assert stats["reused"] == len(paths) - 100
+    assert stats["lexical_indexes"] == 2
+
+    # a fresh process finds the saved index and embeds nothing but the query
+    embeddings.embedded = 0
+    reloaded = PathIndex(embeddings, store=IndexStore(root=str(tmp_path)), backend="numpy")
+    asyncio.run(reloaded.search("o", "r", tree(paths, "rev1"), "routes", k=3))
+    assert embeddings.embedded == 1
+
+
+def test_superseded_revisions_are_pruned(tmp_path):
+    store = IndexStore(root=str(tmp_path))
+    index = PathIndex(CountingEmbeddings(), store=store, backend="numpy")
+    paths = ["src/app/routes.py", "README.md"]
+
+    async def main():
+        for i, revision in enumerate(["rev1", "rev2", "rev3"]):
+            await index.get("o", "r", tree(paths + [f"new_{i}.py"], revision))
+
+    asyncio.run(main())
+    assert store.saved("o/r", index.name) == ["rev3", "rev2"]
+    assert sorted(os.listdir(tmp_path / "o__r")) == ["rev2", "rev3"]
+    assert store.get("o/r", "rev1", index.name) is None
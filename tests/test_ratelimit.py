@@ -0,0 +1,58 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from app.ratelimit import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, GitHubScheduler, request_priority
+
+
+def test_waiters_are_served_by_priority():
+    scheduler = GitHubScheduler(["t1"], reserve=0)
+    # one request of quota left until a reset far in the future: everything else queues
+    scheduler.budgets[0].resource("core").update(remaining=1, reset=time.time() + 3600)
+
+    async def main():
+        held = await scheduler.acquire()
+        served = []
+
+        async def request(name, priority):
+            budget = await scheduler.acquire(priority=priority)
+            served.append(name)
+            scheduler.release(budget)
+
+        async def from_context(name, priority):
+            request_priority.set(priority)  # what LLMRequestMiddleware does per HTTP request
+            await request(name, None)
+
+        tasks = [
+            asyncio.ensure_future(request("background", PRIORITY_BACKGROUND)),
+            asyncio.ensure_future(request("normal", PRIORITY_NORMAL)),
+            asyncio.ensure_future(from_context("interactive", PRIORITY_INTERACTIVE)),
+        ]
+        await asyncio.sleep(0)
+        assert served == [] and scheduler.state()["queued"] == 3
+        scheduler.release(held)
+        await asyncio.gather(*tasks)
+        return served
+
+    assert asyncio.run(main()) == ["interactive", "normal", "background"]
+
+
+def test_exhausted_token_is_parked_until_reset():
+    scheduler = GitHubScheduler(["t1", "t2"])
+    response = SimpleNamespace(status=403, headers={
+        "X-RateLimit-Remaining": "0",
+        "X-RateLimit-Limit": "5000",
+        "X-RateLimit-Reset": str(time.time() + 3600),
+    })
+
+    async def main():
+        first = await scheduler.acquire()
+        delay = await scheduler.observe(first, "core", response, attempt=0)
+        scheduler.release(first)
+        retry = [await scheduler.acquire() for _ in range(3)]
+        return first, delay, retry
+
+    first, delay, retry = asyncio.run(main())
+    assert delay == 0.0
+    assert all(budget is not first for budget in retry)
+    assert scheduler.counters["exhausted"] == 1
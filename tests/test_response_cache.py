@@ -0,0 +1,59 @@
+import asyncio
+import os
+
+from app.cache import ResponseCache
+from app.dataloaders import GitHubClient
+from app.ratelimit import GitHubScheduler
+
+URL = "https://api.github.com/repos/o/r"
+HEADERS = {"ETag": '"v1"'}
+
+
+def test_concurrent_writes_of_one_url(tmp_path):
+    cache = ResponseCache(directory=str(tmp_path))
+
+    async def main():
+        await asyncio.gather(*(cache.put(URL, {"n": n}, HEADERS) for n in range(50)))
+        cache._memory.clear()
+        return await cache.get(URL)
+
+    entry = asyncio.run(main())
+    assert entry["body"]["n"] in range(50)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_entries_are_scoped_to_credentials(tmp_path):
+    cache = ResponseCache(directory=str(tmp_path))
+    private = GitHubScheduler(["private-token"]).fingerprint()
+    public = GitHubScheduler(["public-token"]).fingerprint()
+    assert private != public
+    assert GitHubScheduler(["a", "b"]).fingerprint() == GitHubScheduler(["b", "a"]).fingerprint()
+
+    async def main():
+        await cache.put(URL, {"private": True}, HEADERS, scope=private)
+        cache._memory.clear()
+        return await cache.get(URL, private), await cache.get(URL, public)
+
+    mine, theirs = asyncio.run(main())
+    assert mine["body"] == {"private": True}
+    assert theirs is None
+
+
+def test_inflight_requests_are_shared_only_within_credentials():
+    calls = []
+
+    class CountingClient(GitHubClient):
+        async def _fetch(self, url):
+            calls.append(self.cache_scope)
+            await asyncio.sleep(0.01)
+            return {"scope": self.cache_scope}, None
+
+    private, public = GitHubScheduler(["private-token"]), GitHubScheduler(["public-token"])
+    clients = [CountingClient(cache=None, scheduler=s) for s in (private, private, public)]
+
+    async def main():
+        return await asyncio.gather(*(client.fetch(URL) for client in clients))
+
+    bodies = asyncio.run(main())
+    assert len(calls) == 2
+    assert [body["scope"] for body in bodies] == [c.cache_scope for c in clients]
@@ -0,0 +1,51 @@
+import asyncio
+
+import numpy as np
+
+from goap.retrieval import BM25Index, bm25_index, hybrid_search, tokenize
+
+PATHS = ["src/app/FileTree.py", "src/app/routes.py", "docs/file_tree.md", "README.md"]
+
+
+def test_tokenize_splits_identifiers():
+    assert tokenize("src/FileTree.py") == ["src", "filetree", "file", "tree", "py"]
+    assert tokenize("file_tree") == ["file", "tree"]
+
+
+def test_bm25_top_ranks_matching_documents_only():
+    index = BM25Index(PATHS)
+    assert index.top("file tree", 10)[0] in (0, 2)
+    assert set(index.top("file tree", 10)) == {0, 2}
+    assert index.top("nothing here", 10) == []
+
+
+def test_bm25_index_is_cached_by_key_not_by_content():
+    async def main():
+        first = await bm25_index(PATHS, key=("test", "sha1"))
+        again = await bm25_index(PATHS, key=("test", "sha1"))
+        concurrent = await asyncio.gather(*(bm25_index(PATHS, key=("test", "sha2")) for _ in range(3)))
+        unkeyed = await bm25_index(PATHS)
+        return first, again, concurrent, unkeyed
+
+    first, again, concurrent, unkeyed = asyncio.run(main())
+    assert first is again
+    assert concurrent[0] is concurrent[1] is concurrent[2]
+    assert unkeyed is not first
+
+
+class FakeEmbeddings:
+    """Bag-of-letters vectors: enough for the vector stage to prefer lexical overlap."""
+
+    async def gen(self, texts):
+        vecs = np.zeros((len(texts), 26), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for char in text.lower():
+                if "a" <= char <= "z":
+                    vecs[row, ord(char) - ord("a")] += 1
+        return vecs
+
+
+def test_hybrid_search_returns_texts():
+    result = asyncio.run(hybrid_search(PATHS, "routes", FakeEmbeddings(), k=2, prefilter=2))
+    assert result[0] == "src/app/routes.py"
+    assert len(result) == 2
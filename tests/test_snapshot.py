@@ -0,0 +1,104 @@
+import io
+import asyncio
+import tarfile
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.ratelimit import GitHubScheduler
+from app.sessions import SessionPool
+from app.snapshot import SnapshotRepositoryManager, SnapshotStore
+
+SHA = "a" * 40
+
+
+def tarball(files, sha=SHA):
+    """A GitHub-style tarball: everything under a "<owner>-<repo>-<sha>/" directory."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for path, text in files.items():
+            data = text.encode("utf-8")
+            info = tarfile.TarInfo(f"o-r-{sha[:7]}/{path}")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class FakeGitHub:
+    """Serves the commits and tarball endpoints SnapshotRepositoryManager uses."""
+
+    def __init__(self, files):
+        self.body = tarball(files)
+        self.downloads = 0
+        self.app = web.Application()
+        self.app.router.add_get("/repos/{owner}/{repo}/commits/{ref}", self.commit)
+        self.app.router.add_get("/repos/{owner}/{repo}/tarball/{sha}", self.tarball)
+
+    async def commit(self, request):
+        return web.json_response({"sha": SHA})
+
+    async def tarball(self, request):
+        self.downloads += 1
+        return web.Response(body=self.body, content_type="application/x-gzip")
+
+
+def run_against(fake, store, scenario):
+    async def main():
+        server = TestServer(fake.app)
+        await server.start_server()
+        sessions = SessionPool()
+        try:
+            manager = SnapshotRepositoryManager(
+                store=store, api_url=str(server.make_url("")),
+                sessions=sessions, cache=None, scheduler=GitHubScheduler(["test-token"]),
+            )
+            return await scenario(manager)
+        finally:
+            await sessions.close()
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def test_snapshot_served_from_one_tarball_download(tmp_path):
+    fake = FakeGitHub({"README.md": "# demo\n", "src/app.py": "print('hi')\n"})
+    store = SnapshotStore(root=str(tmp_path))
+
+    async def scenario(manager):
+        tree = await manager.get_filetree("o", "r")
+        readme = await manager.get_readme("o", "r")
+        contents = await manager.get_file_contents("o", "r", ["src/app.py", "missing.py"])
+        read = await manager.local_reader("o", "r", tree)
+        return tree, readme, contents, read
+
+    tree, readme, contents, read = run_against(fake, store, scenario)
+    assert set(tree.files()) == {"README.md", "src/app.py"}
+    assert tree.revision == SHA
+    assert readme == "# demo\n"
+    assert contents["src/app.py"].content == "print('hi')\n"
+    assert contents["missing.py"].error
+    assert read("src/app.py") == "print('hi')\n"
+    assert fake.downloads == 1
+
+
+def ingest(store, sha, text):
+    return store.ingest("o", "r", sha, io.BytesIO(tarball({"file.txt": text}, sha)))
+
+
+def test_evict_enforces_the_budget_but_keeps_pinned_snapshots(tmp_path):
+    store = SnapshotStore(root=str(tmp_path), max_bytes=1)
+    old = ingest(store, "1" * 40, "old contents")
+    with store.pinned(old):
+        ingest(store, "2" * 40, "new contents")
+        # over budget, but a reader holds the older snapshot
+        assert store.manifest("o", "r", "1" * 40) is not None
+        assert store.read(old["entries"]["file.txt"]["digest"]) == "old contents"
+
+    ingest(store, "3" * 40, "newest contents")  # loaded manifests do not block eviction
+    assert store.manifest("o", "r", "1" * 40) is None
+    assert store.manifest("o", "r", "2" * 40) is None
+    assert list(store._loaded) == ["o__r__" + "3" * 40]
+
+    store.evict()
+    assert store.manifest("o", "r", "3" * 40) is None
+    assert not store._loaded